@@ -0,0 +1,85 @@
+import hashlib
+import re
+import numpy as np
+from collections import defaultdict
+from typing import List, Dict, Tuple
+from ..pipeline.rerank import CrossEncoderReranker
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+class InMemoryChunkStore:
+    
+    def __init__(self):
+        self.rows = {}
+        self.postings = defaultdict(set)
+    
+    def add(self, rows: List[tuple]):
+        for row in rows:
+            chunk_id, _, section_title, chunk_text = row[:4]
+            self.rows[chunk_id] = tuple(row)
+            for token in set(_TOKEN.findall(f"{section_title} {chunk_text}".lower())):
+                self.postings[token].add(chunk_id)
+    
+    def fetch_chunks(self, chunk_ids: List[str]) -> List[Dict]:
+        chunks = []
+        for chunk_id in chunk_ids:
+            row = self.rows.get(chunk_id)
+            if row:
+                chunks.append({
+                    "id": row[0], "filename": row[1], "title": row[2], "content": row[3], "chunk_index": row[4],
+                    "page_num": row[5], "page_end": row[6]
+                })
+        return chunks
+    
+    def _matches(self, row: tuple, filters: Dict) -> bool:
+        _, filename, section_title, _, _, page_num, page_end = row
+        if filters.get("filename") and filename != filters["filename"]:
+            return False
+        section = filters.get("section_title")
+        if section and section_title != section and not section_title.startswith(f"{section} (Part "):
+            return False
+        if filters.get("page_from") is not None and page_end < filters["page_from"]:
+            return False
+        return filters.get("page_to") is None or page_num <= filters["page_to"]
+    
+    def search_lexical(self, question: str, limit: int, filters: Dict = None) -> List[str]:
+        scores = defaultdict(int)
+        for token in set(_TOKEN.findall(question.lower())):
+            for chunk_id in self.postings.get(token, ()):
+                if not filters or self._matches(self.rows[chunk_id], filters):
+                    scores[chunk_id] += 1
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+    
+    def corpus_version(self) -> str:
+        return str(len(self.rows))
+    
+    def close(self):
+        pass
+
+class HashingEmbedder:
+    
+    def __init__(self, dimension: int = 384):
+        self.mode = "hash"
+        self.batch_size = 0
+        self.dimension = dimension
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN.findall(text.lower()):
+                bucket = int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16) % self.dimension
+                embeddings[row, bucket] += 1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-9)
+
+class OverlapReranker(CrossEncoderReranker):
+    
+    def load(self) -> "OverlapReranker":
+        return self
+    
+    def predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        scores = []
+        for question, text in pairs:
+            terms = set(_TOKEN.findall(question.lower()))
+            scores.append(len(terms & set(_TOKEN.findall(text.lower()))) / len(terms) if terms else 0.0)
+        return np.asarray(scores, dtype=np.float32)
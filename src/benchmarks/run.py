@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+from fastapi import Response
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple
+from ..pipeline.data_ingest import iter_processed_pdfs, list_pdf_files
+from ..pipeline.data_processing import DataProcessor
+from ..pipeline.embeddings import EmbeddingBackend
+from ..pipeline.vector_index import LocalVectorIndex
+from ..pipeline.cache import QueryCache
+from ..pipeline.batching import EmbeddingBatcher
+from ..pipeline.context import ContextPacker
+from ..pipeline.generation import GenerationClient, StubLLM
+from ..pipeline.rerank import CrossEncoderReranker
+from .fakes import InMemoryChunkStore, HashingEmbedder, OverlapReranker
+
+DEFAULT_PDF_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "pdfs")
+
+def replicate_corpus(source_dir: str, target_docs: int, work_dir: str) -> str:
+    source_files = list_pdf_files(source_dir)
+    if not source_files:
+        raise SystemExit(f"No PDFs found in {source_dir}")
+    
+    corpus_dir = os.path.join(work_dir, "pdfs")
+    os.makedirs(corpus_dir)
+    for i in range(target_docs):
+        source = source_files[i % len(source_files)]
+        copy = i // len(source_files)
+        name = source if copy == 0 else f"{os.path.splitext(source)[0]}_copy{copy}.pdf"
+        shutil.copyfile(os.path.join(source_dir, source), os.path.join(corpus_dir, name))
+    
+    return corpus_dir
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean())
+    }
+
+def bench_extraction(corpus_dir: str, workers: int) -> Tuple[Dict, List[Tuple[str, List[Dict]]]]:
+    documents = []
+    pages = 0
+    started = time.perf_counter()
+    for filename, chunks, page_count, _ in iter_processed_pdfs(corpus_dir, max_workers=workers):
+        documents.append((filename, chunks))
+        pages += page_count
+    elapsed = time.perf_counter() - started
+    
+    chunk_count = sum(len(chunks) for _, chunks in documents)
+    return {
+        "documents": len(documents),
+        "pages": pages,
+        "chunks": chunk_count,
+        "seconds": elapsed,
+        "pages_per_second": pages / elapsed if elapsed else 0.0
+    }, documents
+
+def bench_ingestion(documents: List[Tuple[str, List[Dict]]], embedder, index_dir: str):
+    processor = DataProcessor()
+    processor.embedder = embedder
+    processor.vector_store = LocalVectorIndex(path=index_dir).load(writable=True)
+    chunk_store = InMemoryChunkStore()
+    
+    embed_seconds = 0.0
+    store_seconds = 0.0
+    chunk_count = 0
+    for filename, chunks in documents:
+        if not chunks:
+            continue
+        
+        started = time.perf_counter()
+        embedded = processor.embed_document_chunks(filename, chunks)
+        embed_seconds += time.perf_counter() - started
+        
+        started = time.perf_counter()
+        processor.store_chunks_in_vector_store(
+            embedded["chunk_ids"], embedded["embeddings"], embedded["metadatas"], embedded["texts"]
+        )
+        chunk_store.add(embedded["rows"])
+        store_seconds += time.perf_counter() - started
+        chunk_count += len(chunks)
+    
+    started = time.perf_counter()
+    processor.vector_store.snapshot()
+    snapshot_seconds = time.perf_counter() - started
+    
+    return {
+        "chunks": chunk_count,
+        "embed_seconds": embed_seconds,
+        "embed_chunks_per_second": chunk_count / embed_seconds if embed_seconds else 0.0,
+        "store_seconds": store_seconds,
+        "store_chunks_per_second": chunk_count / store_seconds if store_seconds else 0.0,
+        "snapshot_seconds": snapshot_seconds
+    }, processor.vector_store, chunk_store
+
+async def bench_queries(args, vector_store, chunk_store: InMemoryChunkStore, embedder, reranker,
+                        questions: List[str], concurrency: int) -> Dict:
+    from .. import main as api
+    
+    # The app's globals are normally filled by its lifespan hook; point them at the stand-ins instead
+    api.embedding_executor = ThreadPoolExecutor(max_workers=int(os.getenv("EMBEDDING_WORKERS", "2")))
+    api.io_executor = ThreadPoolExecutor(max_workers=int(os.getenv("IO_WORKERS", "16")))
+    rerank_workers = int(os.getenv("RERANK_WORKERS", "1"))
+    api.rerank_executor = ThreadPoolExecutor(max_workers=rerank_workers)
+    api.rerank_slots = threading.BoundedSemaphore(rerank_workers + int(os.getenv("RERANK_MAX_QUEUE", "2")))
+    api.chunk_store = chunk_store
+    api.vector_store = vector_store
+    api.embedder = embedder
+    api.reranker = reranker
+    api.generation_client = GenerationClient(StubLLM(args.llm_latency_ms, args.llm_jitter_ms, seed=args.seed))
+    api.query_cache = QueryCache()
+    api.context_packer = ContextPacker()
+    if args.no_cache:
+        for level in (api.query_cache.embeddings, api.query_cache.retrievals, api.query_cache.answers,
+                      api.query_cache.rerank_scores):
+            level.maxsize = 0
+    api.embedding_batcher = EmbeddingBatcher(api.encode_questions, api.embedding_executor)
+    api.embedding_batcher.start()
+    
+    latencies = []
+    stages = {}
+    failures = 0
+    slots = asyncio.Semaphore(concurrency)
+    
+    async def run_one(question: str):
+        nonlocal failures
+        async with slots:
+            started = time.perf_counter()
+            try:
+                response = await api.query_documents(
+                    api.QueryRequest(question=question, top_k=args.top_k, mode=args.mode), Response()
+                )
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            for stage, milliseconds in response.timings.items():
+                stages.setdefault(stage, []).append(milliseconds / 1000)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(question) for question in questions))
+    elapsed = time.perf_counter() - started
+    
+    await api.embedding_batcher.stop()
+    api.embedding_executor.shutdown()
+    api.io_executor.shutdown()
+    api.rerank_executor.shutdown()
+    
+    result = {
+        "concurrency": concurrency,
+        "requests": len(questions),
+        "failures": failures,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "embedding_batches": api.embedding_batcher.stats(),
+        "cache": api.query_cache.stats(),
+        "stages": {stage: percentiles(seconds) for stage, seconds in stages.items()}
+    }
+    if latencies:
+        result.update(percentiles(latencies))
+    return result
+
+def make_questions(documents: List[Tuple[str, List[Dict]]], count: int, seed: int) -> List[str]:
+    texts = [chunk["text"] for _, chunks in documents for chunk in chunks if chunk["text"]]
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(texts).split()[:12]) for _ in range(count)]
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and query benchmark")
+    parser.add_argument("--pdf-dir", default=DEFAULT_PDF_DIR)
+    parser.add_argument("--target-docs", type=int, default=24, help="replicate the PDFs up to this many documents")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes")
+    parser.add_argument("--embedding-backend", default="fp32", choices=["fp32", "int8", "hash"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", default="dense", choices=["dense", "lexical", "hybrid"])
+    parser.add_argument("--rerank", default="none", choices=["none", "cross-encoder", "overlap"],
+                        help="second-stage reranker; overlap scores by shared terms and needs no model")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--no-cache", action="store_true", help="disable the query caches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+    
+    embedder = HashingEmbedder() if args.embedding_backend == "hash" else \
+        EmbeddingBackend(mode=args.embedding_backend).load()
+    reranker = None
+    if args.rerank != "none":
+        reranker = (OverlapReranker() if args.rerank == "overlap" else CrossEncoderReranker()).load()
+    
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        corpus_dir = replicate_corpus(args.pdf_dir, args.target_docs, work_dir)
+        extraction, documents = bench_extraction(corpus_dir, args.workers)
+        ingestion, vector_store, chunk_store = bench_ingestion(
+            documents, embedder, os.path.join(work_dir, "vector_index")
+        )
+        
+        queries = []
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            questions = make_questions(documents, args.queries, args.seed)
+            queries.append(asyncio.run(
+                bench_queries(args, vector_store, chunk_store, embedder, reranker, questions, concurrency)
+            ))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "extraction": extraction,
+        "ingestion": ingestion,
+        "query": queries
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    
+    print(f"extraction: {extraction['pages_per_second']:.1f} pages/s over {extraction['pages']} pages")
+    print(f"embedding: {ingestion['embed_chunks_per_second']:.1f} chunks/s, "
+          f"storage: {ingestion['store_chunks_per_second']:.1f} chunks/s")
+    for result in queries:
+        print(f"query c={result['concurrency']}: p50 {result.get('p50_ms', 0):.1f}ms, "
+              f"p95 {result.get('p95_ms', 0):.1f}ms, p99 {result.get('p99_ms', 0):.1f}ms, "
+              f"{result['throughput_rps']:.1f} req/s")
+        stage_p50 = ", ".join(f"{stage} {stats['p50_ms']:.1f}ms" for stage, stats in result["stages"].items())
+        print(f"  stage p50: {stage_p50}")
+    print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
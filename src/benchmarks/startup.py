@@ -0,0 +1,108 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+from .. import main as api
+from ..pipeline.metrics import process_memory
+from .run import git_commit
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+def measure_import(module: str, runs: int) -> Optional[float]:
+    # A fresh interpreter per run, so nothing is already in sys.modules
+    script = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    try:
+        return min(
+            float(subprocess.check_output([sys.executable, "-c", script], cwd=REPO_ROOT, stderr=subprocess.DEVNULL))
+            for _ in range(runs)
+        )
+    except subprocess.CalledProcessError:
+        return None
+
+def _worker(preloaded: bool, barrier, results):
+    started = time.perf_counter()
+    if not preloaded:
+        api.load_embedder()
+    api.warm_up_embedder()
+    ready_seconds = time.perf_counter() - started
+    
+    # Measure once every worker has loaded, the way they would sit side by side under gunicorn
+    barrier.wait()
+    results.put(dict(process_memory(), ready_seconds=ready_seconds))
+    barrier.wait()
+
+def measure_workers(workers: int, preload: bool) -> Dict:
+    context = multiprocessing.get_context("fork")
+    if preload and api.embedder is None:
+        api.preload_model()
+    
+    barrier = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(preload, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    
+    barrier.wait()
+    per_worker = [results.get() for _ in processes]
+    barrier.wait()
+    for process in processes:
+        process.join()
+    
+    return {
+        "preload": preload,
+        "workers": workers,
+        "per_worker": per_worker,
+        "mean_rss_bytes": sum(w["rss"] for w in per_worker) / workers,
+        "mean_uss_bytes": sum(w["uss"] for w in per_worker) / workers,
+        "total_pss_bytes": sum(w["pss"] for w in per_worker),
+        "mean_ready_seconds": sum(w["ready_seconds"] for w in per_worker) / workers
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import time, model load time and per-worker memory")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--import-runs", type=int, default=3)
+    parser.add_argument("--output", default="startup_results.json")
+    args = parser.parse_args()
+    
+    imports = {module: measure_import(module, args.import_runs) for module in ("src.main", "chromadb",
+                                                                            "google.generativeai", "torch")}
+    
+    started = time.perf_counter()
+    api.load_embedder()
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    api.warm_up_embedder()
+    warmup_seconds = time.perf_counter() - started
+    
+    # The per-worker run must fork before the parent holds a model, so it drops the one loaded above
+    api.embedder = None
+    workers: List[Dict] = [measure_workers(args.workers, preload=False), measure_workers(args.workers, preload=True)]
+    
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "import_seconds": imports,
+        "model_load_seconds": load_seconds,
+        "warmup_seconds": warmup_seconds,
+        "workers": workers
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    
+    print("import: " + ", ".join(f"{module} {seconds:.2f}s" for module, seconds in imports.items() if seconds is not None))
+    print(f"model load: {load_seconds:.2f}s, warmup: {warmup_seconds:.2f}s")
+    for result in workers:
+        print(f"{'preload' if result['preload'] else 'per-worker load'} x{result['workers']}: "
+              f"rss {result['mean_rss_bytes'] / 2**20:.0f} MiB, uss {result['mean_uss_bytes'] / 2**20:.0f} MiB per worker, "
+              f"pss {result['total_pss_bytes'] / 2**20:.0f} MiB total, ready in {result['mean_ready_seconds']:.2f}s")
+    print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+
+bind = f"0.0.0.0:{os.getenv('API_PORT', '8080')}"
+workers = int(os.getenv("API_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("API_WORKER_TIMEOUT", "120"))
+
+def on_starting(server):
+    # Runs once in the master; forked workers inherit the loaded weights instead of reading their own copy
+    if os.getenv("PRELOAD_MODEL", "true").lower() == "true":
+        from src.main import preload_model
+        preload_model()
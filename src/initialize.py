@@ -1,12 +1,17 @@
 
+import logging
 import time
 import os
 from dotenv import load_dotenv
 from pipeline.db_setup import setup_postgres, setup_chromadb
+from pipeline.sharding import chroma_hosts
+from pipeline import metrics
 from pipeline.data_processing import DataProcessor
 
 load_dotenv()
 
+logger = logging.getLogger("initialize")
+
 def wait_for_services(max_retries: int = 30, retry_delay: int = 2):
     import psycopg2
     import chromadb
@@ -27,26 +32,27 @@ def wait_for_services(max_retries: int = 30, retry_delay: int = 2):
             else:
                 raise
     
+    if os.getenv("VECTOR_BACKEND", "chroma") == "local":
+        return
+    
     for attempt in range(max_retries):
         try:
-            client = chromadb.HttpClient(
-                host=os.getenv("CHROMA_HOST", "chromadb"),
-                port=int(os.getenv("CHROMA_PORT", "8000"))
-            )
-            client.list_collections()
+            for host, port in chroma_hosts("chromadb"):
+                chromadb.HttpClient(host=host, port=port).list_collections()
             break
         except Exception as e:
             if attempt < max_retries - 1:
                 time.sleep(retry_delay)
             else:
                 raise
-def initialize_rag_system():
+def initialize_rag_system(force: bool = False, rebuild: bool = False):
     
     try:
         wait_for_services()
         
         setup_postgres()
-        setup_chromadb()
+        if os.getenv("VECTOR_BACKEND", "chroma") != "local":
+            setup_chromadb()
         
         processor = DataProcessor()
         
@@ -54,18 +60,27 @@ def initialize_rag_system():
             processor.initialize_connections()
             
             pdf_directory = "/app/data/pdfs"
-            if os.path.exists(pdf_directory):
-                processor.process_all_documents(pdf_directory)
-            else:
+            if not os.path.exists(pdf_directory):
                 pdf_directory = "./data/pdfs"
-                if os.path.exists(pdf_directory):
-                    processor.process_all_documents(pdf_directory)
+            if os.path.exists(pdf_directory):
+                stats = processor.process_all_documents(pdf_directory, clear_existing=rebuild, force=force)
+                print(stats.summary())
+                if os.getenv("INGEST_METRICS_TEXTFILE"):
+                    metrics.write_textfile(os.getenv("INGEST_METRICS_TEXTFILE"))
         
         except Exception:
-            pass
+            logger.exception("Document ingestion failed")
         finally:
             processor.close_connections()
     except Exception:
-        pass
+        logger.exception("RAG system initialization failed")
 if __name__ == "__main__":
-    initialize_rag_system()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Set up the stores and ingest the PDF directory")
+    parser.add_argument("--force", action="store_true", help="reprocess every PDF, not only new and changed ones")
+    parser.add_argument("--rebuild", action="store_true", help="clear both stores before ingesting")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    initialize_rag_system(force=args.force, rebuild=args.rebuild)
@@ -1,102 +1,795 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-import chromadb
-import psycopg2
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from fastapi import Depends, FastAPI, File, HTTPException, Request, Response, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+import asyncio
+import gc
+import json
+import logging
 import os
-from typing import List
+import threading
+import time
+import numpy as np
+from typing import AsyncIterator, Dict, List, Literal, Optional, Tuple
 from dotenv import load_dotenv
+from .pipeline.chunk_store import ChunkStore
+from .pipeline.cache import QueryCache
+from .pipeline.batching import EmbeddingBatcher
+from .pipeline.embeddings import EmbeddingBackend
+from .pipeline.vector_index import LocalVectorIndex
+from .pipeline.sharding import ChromaShards, chroma_hosts
+from .pipeline.retrieval import build_where, reciprocal_rank_fusion
+from .pipeline.context import ContextPacker
+from .pipeline.generation import (
+    GenerationClient, GenerationOverloaded, GenerationTimeout, GenerationUnavailable, StubLLM
+)
+from .pipeline.rerank import CrossEncoderReranker, rerank_enabled
+from .pipeline.jobs import JobQueue, pdf_directory
+from .pipeline import metrics
 
 load_dotenv()
 
-pg_conn = None
-chroma_client = None
-chroma_collection = None
-model = None
+logger = logging.getLogger(__name__)
+
+chunk_store = None
+vector_store = None
+embedder = None
+reranker = None
 gemini_model = None
+generation_client = None
+embedding_executor = None
+io_executor = None
+rerank_executor = None
+rerank_slots = None
+query_cache = None
+embedding_batcher = None
+context_packer = None
+version_watcher = None
+job_queue = None
+ready = False
+startup_error = None
+startup_timings = {}
+
+def preload_model():
+    # Called in the gunicorn master before forking, so every worker shares the weights copy-on-write
+    global embedder, reranker
+    embedder = EmbeddingBackend().load()
+    if rerank_enabled():
+        reranker = CrossEncoderReranker().load()
+    gc.freeze()
+
+def connect_stores():
+    global chunk_store, vector_store
+    
+    chunk_store = ChunkStore()
+    chunk_store.connect()
+    
+    if os.getenv("VECTOR_BACKEND", "chroma") == "local":
+        vector_store = LocalVectorIndex().load()
+    else:
+        vector_store = ChromaShards(hosts=chroma_hosts("chromadb")).connect()
+
+def load_embedder():
+    global embedder
+    if embedder is None:
+        embedder = EmbeddingBackend().load()
+
+def warm_up_embedder():
+    # The first forward pass allocates buffers and selects kernels; pay for it before taking traffic
+    embedder.encode(["What problem does this paper address?"] * int(os.getenv("EMBEDDING_BATCH_SIZE", "32")))
+
+def load_reranker():
+    global reranker
+    if reranker is None:
+        reranker = CrossEncoderReranker().load()
+
+def warm_up_reranker():
+    reranker.score([("What problem does this paper address?", "warm up " * 64)] * reranker.batch_size)
+
+def load_generator():
+    global gemini_model, generation_client
+    
+    if os.getenv("LLM_BACKEND", "gemini") == "stub":
+        gemini_model = StubLLM()
+    else:
+        import google.generativeai as genai
+        
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+    generation_client = GenerationClient(gemini_model)
+
+async def startup_phase(phase: str, awaitable):
+    started = time.perf_counter()
+    result = await awaitable
+    startup_timings[phase] = round(time.perf_counter() - started, 3)
+    metrics.STARTUP_SECONDS.set(startup_timings[phase], phase=phase)
+    return result
+
+async def start_services():
+    global query_cache, embedding_batcher, context_packer, version_watcher, job_queue, ready, startup_error
+    
+    try:
+        # Connections, model weights and the Gemini client load concurrently on separate threads
+        phases = [
+            startup_phase("connect", run_in_executor(io_executor, connect_stores)),
+            startup_phase("load_model", run_in_executor(embedding_executor, load_embedder)),
+            startup_phase("load_generator", run_in_executor(io_executor, load_generator))
+        ]
+        if rerank_enabled():
+            phases.append(startup_phase("load_reranker", run_in_executor(rerank_executor, load_reranker)))
+        await asyncio.gather(*phases)
+        await startup_phase("warmup", run_in_executor(embedding_executor, warm_up_embedder))
+        if reranker is not None:
+            await startup_phase("warmup_reranker", run_in_executor(rerank_executor, warm_up_reranker))
+        
+        embedding_batcher = EmbeddingBatcher(encode_questions, embedding_executor)
+        embedding_batcher.start()
+        context_packer = ContextPacker()
+        job_queue = JobQueue(chunk_store)
+        
+        query_cache = QueryCache()
+        await refresh_corpus_version()
+        version_watcher = asyncio.create_task(watch_corpus_version())
+    except Exception as e:
+        startup_error = f"{type(e).__name__}: {e}"
+        logger.exception("Startup failed")
+        return
+    
+    startup_timings["ready"] = round(metrics.process_age(), 3)
+    metrics.STARTUP_SECONDS.set(startup_timings["ready"], phase="ready")
+    ready = True
+    logger.info("Ready in %.2fs: %s", startup_timings["ready"], startup_timings)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global pg_conn, chroma_client, chroma_collection, model, gemini_model
+    global embedding_executor, io_executor, rerank_executor, rerank_slots
     
-    pg_conn = psycopg2.connect(
-        host=os.getenv("DB_HOST", "postgres_db"),
-        database=os.getenv("DB_NAME", "ragdb"),
-        user=os.getenv("DB_USER", "raguser"),
-        password=os.getenv("DB_PASSWORD", "ragpass")
+    embedding_executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv("EMBEDDING_WORKERS", "2")),
+        thread_name_prefix="embed"
     )
-    
-    chroma_client = chromadb.HttpClient(
-        host=os.getenv("CHROMA_HOST", "chromadb"),
-        port=int(os.getenv("CHROMA_PORT", "8000"))
+    io_executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv("IO_WORKERS", "16")),
+        thread_name_prefix="io"
     )
+    # Reranking gets its own threads, so scoring that runs past its budget never holds up question encoding
+    rerank_workers = int(os.getenv("RERANK_WORKERS", "1"))
+    rerank_executor = ThreadPoolExecutor(max_workers=rerank_workers, thread_name_prefix="rerank")
+    rerank_slots = threading.BoundedSemaphore(rerank_workers + int(os.getenv("RERANK_MAX_QUEUE", "2")))
     
-    try:
-        chroma_collection = chroma_client.get_collection("document_chunks")
-    except Exception:
-        chroma_collection = chroma_client.create_collection(
-            name="document_chunks",
-            metadata={"description": "Document chunks for RAG system"}
-        )
-    
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+    # Loading runs in the background so the server answers liveness probes straight away
+    startup = asyncio.create_task(start_services())
     
     yield
+    
+    startup.cancel()
+    if version_watcher:
+        version_watcher.cancel()
+    if embedding_batcher:
+        await embedding_batcher.stop()
+    if chunk_store:
+        chunk_store.close()
+    embedding_executor.shutdown(wait=False)
+    io_executor.shutdown(wait=False)
+    rerank_executor.shutdown(wait=False)
 
 app = FastAPI(title="Simple RAG API", version="1.0.0", lifespan=lifespan)
 
+MAX_TOP_K = int(os.getenv("QUERY_MAX_TOP_K", "50"))
+
+class QueryFilters(BaseModel):
+    filename: Optional[str] = None
+    section_title: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+
 class QueryRequest(BaseModel):
     question: str
-    top_k: int = 5
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    mode: Literal["dense", "lexical", "hybrid"] = "dense"
+    filters: Optional[QueryFilters] = None
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[dict]
-@app.post("/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
-    question_embedding = model.encode([request.question])
-    results = chroma_collection.query(
-        query_embeddings=question_embedding.tolist(),
-        n_results=request.top_k
+    timings: Dict[str, float] = {}
+    context: Dict[str, int] = {}
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    mode: Literal["dense", "lexical", "hybrid"] = "dense"
+    filters: Optional[QueryFilters] = None
+    generate: bool = True
+
+class BatchQueryResult(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    sources: List[dict]
+    error: Optional[str] = None
+    context: Dict[str, int] = {}
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+    timings: Dict[str, float] = {}
+
+def require_ready():
+    if not ready:
+        raise HTTPException(
+            status_code=503,
+            detail=startup_error or "Service is starting",
+            headers={"Retry-After": "5"}
+        )
+
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information to answer your question."
+
+GENERATION_ERRORS = (GenerationOverloaded, GenerationTimeout, GenerationUnavailable)
+
+def generation_unavailable(error: Exception) -> HTTPException:
+    if isinstance(error, GenerationOverloaded):
+        return HTTPException(status_code=503, detail=str(error),
+                             headers={"Retry-After": os.getenv("GENERATION_RETRY_AFTER", "1")})
+    if isinstance(error, GenerationUnavailable):
+        return HTTPException(status_code=502, detail=str(error))
+    return HTTPException(status_code=504, detail=str(error))
+
+def generation_status(error: Exception) -> str:
+    if isinstance(error, GenerationOverloaded):
+        return "shed"
+    return "timeout" if isinstance(error, GenerationTimeout) else "unavailable"
+
+async def run_in_executor(executor, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args))
+
+async def timed(timings: Dict[str, float], stage: str, awaitable, scope: str = "request"):
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        seconds = time.perf_counter() - started
+        timings[stage] = round(seconds * 1000, 3)
+        metrics.QUERY_STAGE_LATENCY.observe(seconds, stage=stage, scope=scope)
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={duration}" for stage, duration in timings.items())
+
+def record_query(endpoint: str, mode: str, status: str, started: float):
+    metrics.QUERY_REQUESTS.inc(endpoint=endpoint, mode=mode, status=status)
+    metrics.QUERY_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+
+async def refresh_corpus_version():
+    corpus_version = await run_in_executor(io_executor, chunk_store.corpus_version)
+    if isinstance(vector_store, LocalVectorIndex):
+        # Ingestion commits rows per document but publishes vectors once per run; the cache follows both
+        await run_in_executor(io_executor, vector_store.reload_if_changed)
+        corpus_version = f"{corpus_version}:{vector_store.snapshot_version}"
+    query_cache.sync_corpus_version(corpus_version)
+
+async def watch_corpus_version():
+    interval = float(os.getenv("CACHE_VERSION_CHECK_INTERVAL", "30"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_corpus_version()
+        except Exception:
+            logger.warning("Corpus version check failed", exc_info=True)
+
+def encode_questions(questions: List[str]) -> List[List[float]]:
+    return embedder.encode(questions).tolist()
+
+def vector_include() -> List[str]:
+    # MMR needs the chunk vectors; the first-stage query already has them, so they come back with it
+    return ["distances", "embeddings"] if context_packer.mmr else ["distances"]
+
+def remember_chunk_embeddings(results: Dict):
+    if results.get("embeddings") is None:
+        return
+    for chunk_ids, embeddings in zip(results["ids"], results["embeddings"]):
+        for chunk_id, embedding in zip(chunk_ids, embeddings):
+            query_cache.chunk_embeddings.set(chunk_id, np.asarray(embedding, dtype=np.float32))
+
+def search_chunk_ids(question_embedding: List[float], top_k: int, where: Dict = None) -> Tuple[List[str], bool]:
+    results = vector_store.query(
+        query_embeddings=[question_embedding],
+        n_results=top_k,
+        where=where,
+        include=vector_include()
     )
-    
-    chunk_ids = results['ids'][0] if results['ids'] else []
-    sources = []
-    context_texts = []
-    
-    with pg_conn.cursor() as cur:
-        for chunk_id in chunk_ids:
-            cur.execute(
-                "SELECT paper_filename, section_title, chunk_text FROM chunks WHERE id = %s",
-                (chunk_id,)
-            )
-            result = cur.fetchone()
-            if result:
-                sources.append({
-                    "filename": result[0],
-                    "title": result[1],
-                    "content": result[2]
-                })
-                context_texts.append(result[2])
-    
-    if context_texts:
-        context = "\n\n".join(context_texts)
-        prompt = f"""Based on the following context, please answer the question. If the context doesn't contain enough information to answer the question, say so.
+    remember_chunk_embeddings(results)
+    return (results['ids'][0] if results['ids'] else []), results.get("partial", False)
+
+def search_chunk_ids_batch(question_embeddings: List[List[float]], top_k: int,
+                           where: Dict = None) -> Tuple[List[List[str]], bool]:
+    results = vector_store.query(
+        query_embeddings=question_embeddings,
+        n_results=top_k,
+        where=where,
+        include=vector_include()
+    )
+    remember_chunk_embeddings(results)
+    return results['ids'] or [[] for _ in question_embeddings], results.get("partial", False)
+
+def fetch_chunk_embeddings(chunk_ids: List[str]) -> Dict[str, List[float]]:
+    embeddings = {chunk_id: query_cache.chunk_embeddings.get(chunk_id) for chunk_id in chunk_ids}
+    # Only chunks the vector search did not return, such as lexical-only hits, cost a round trip
+    missing = [chunk_id for chunk_id, embedding in embeddings.items() if embedding is None]
+    if missing:
+        results = vector_store.get(ids=missing, include=["embeddings"])
+        remember_chunk_embeddings({"ids": [results["ids"]], "embeddings": [results["embeddings"]]})
+        embeddings.update(zip(results["ids"], results["embeddings"]))
+    return {chunk_id: embedding for chunk_id, embedding in embeddings.items() if embedding is not None}
+
+def build_prompt(question: str, context_texts: List[str]) -> str:
+    context = "\n\n".join(context_texts)
+    return f"""Based on the following context, please answer the question. If the context doesn't contain enough information to answer the question, say so.
 
 Context:
 {context}
 
-Question: {request.question}
+Question: {question}
 
 Answer:"""
-        
-        response = gemini_model.generate_content(prompt)
-        answer = response.text
+
+async def embed_question(question: str) -> List[float]:
+    key = query_cache.embedding_key(question)
+    question_embedding = query_cache.embeddings.get(key)
+    if question_embedding is None:
+        question_embedding = await embedding_batcher.encode(question)
+        query_cache.embeddings.set(key, question_embedding)
+    return question_embedding
+
+async def embed_questions(questions: List[str]) -> List[List[float]]:
+    keys = [query_cache.embedding_key(question) for question in questions]
+    # The key is normalized text; the model sees the question as asked, as in embed_question
+    originals = dict(zip(reversed(keys), reversed(questions)))
+    embeddings = {key: query_cache.embeddings.get(key) for key in originals}
+    
+    # Unseen questions skip the micro-batcher and go through the model as one forward pass
+    missing = [key for key, embedding in embeddings.items() if embedding is None]
+    if missing:
+        encoded = await run_in_executor(embedding_executor, encode_questions, [originals[key] for key in missing])
+        for key, embedding in zip(missing, encoded):
+            embeddings[key] = embedding
+            query_cache.embeddings.set(key, embedding)
+    
+    return [embeddings[key] for key in keys]
+
+def filters_dict(filters: Optional[QueryFilters]) -> Dict:
+    return filters.model_dump(exclude_none=True) if filters else {}
+
+def score_rerank_pairs(keys: List[str], pairs: List[Tuple[str, str]]) -> List[float]:
+    # Cached from the worker thread, so a call that overran the budget still serves the next request
+    scores = reranker.score(pairs)
+    for key, score in zip(keys, scores):
+        query_cache.rerank_scores.set(key, score)
+    return scores
+
+async def rerank_candidates(questions: List[str], candidates: List[List[dict]], top_k: int,
+                            started: float) -> Optional[List[List[dict]]]:
+    scores = {}
+    missing = {}
+    for question, sources in zip(questions, candidates):
+        for source in sources:
+            key = query_cache.rerank_key(question, source["id"])
+            if key in scores or key in missing:
+                continue
+            score = query_cache.rerank_scores.get(key)
+            if score is None:
+                missing[key] = (question, source["content"])
+            else:
+                scores[key] = score
+    metrics.RERANK_PAIRS.inc(len(scores), result="cached")
+    
+    if missing:
+        # The budget covers retrieval as a whole; the first stage may already have used it up
+        remaining = reranker.budget - (time.perf_counter() - started)
+        if remaining <= reranker.estimate_seconds(len(missing)):
+            metrics.RERANK_REQUESTS.inc(outcome="skipped")
+            return None
+        # A call that timed out keeps its slot until it finishes, so a slow reranker sheds work instead of queueing it
+        if not rerank_slots.acquire(blocking=False):
+            metrics.RERANK_REQUESTS.inc(outcome="busy")
+            return None
+        future = rerank_executor.submit(score_rerank_pairs, list(missing), list(missing.values()))
+        future.add_done_callback(lambda _: rerank_slots.release())
+        try:
+            computed = await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+        except asyncio.TimeoutError:
+            metrics.RERANK_REQUESTS.inc(outcome="timeout")
+            return None
+        except Exception:
+            logger.warning("Reranking failed, keeping the first-stage order", exc_info=True)
+            metrics.RERANK_REQUESTS.inc(outcome="error")
+            return None
+        scores.update(zip(missing, computed))
+        metrics.RERANK_PAIRS.inc(len(missing), result="scored")
+    
+    metrics.RERANK_REQUESTS.inc(outcome="reranked")
+    reranked = []
+    for question, sources in zip(questions, candidates):
+        scored = [dict(source, rerank_score=scores[query_cache.rerank_key(question, source["id"])])
+                  for source in sources]
+        scored.sort(key=lambda source: source["rerank_score"], reverse=True)
+        reranked.append(scored[:top_k])
+    return reranked
+
+def candidate_depth(top_k: int, mode: str) -> Tuple[int, int]:
+    # With a reranker the first stage over-fetches, and only the best top_k reach the prompt
+    candidates = reranker.candidate_depth(top_k) if reranker is not None else top_k
+    depth = candidates * int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "2")) if mode == "hybrid" else candidates
+    return candidates, depth
+
+async def retrieve_sources_batch(questions: List[str], top_k: int, mode: str, timings: Dict[str, float],
+                                 filters: Dict = None) -> List[List[dict]]:
+    started = time.perf_counter()
+    question_embeddings = [None] * len(questions)
+    if mode != "lexical":
+        question_embeddings = await timed(timings, "embed", embed_questions(questions), "batch")
+    
+    keys = [query_cache.retrieval_key(embedding, top_k, mode, question, filters)
+            for question, embedding in zip(questions, question_embeddings)]
+    results = [query_cache.retrievals.get(key) for key in keys]
+    misses = [i for i, sources in enumerate(results) if sources is None]
+    if not misses:
+        return results
+    
+    candidates, depth = candidate_depth(top_k, mode)
+    where = build_where(filters or {})
+    legs = []
+    if mode != "lexical":
+        legs.append(timed(timings, "vector_search", run_in_executor(
+            io_executor, search_chunk_ids_batch, [question_embeddings[i] for i in misses], depth, where
+        ), "batch"))
+    if mode != "dense":
+        legs.append(timed(timings, "lexical_search", asyncio.gather(*(
+            run_in_executor(io_executor, chunk_store.search_lexical, questions[i], depth, filters) for i in misses
+        )), "batch"))
+    rankings = await asyncio.gather(*legs)
+    partial = False
+    if mode != "lexical":
+        rankings[0], partial = rankings[0]
+    
+    if len(rankings) > 1:
+        ranked_ids = [reciprocal_rank_fusion(list(per_question))[:candidates] for per_question in zip(*rankings)]
     else:
-        answer = "I couldn't find any relevant information to answer your question."
+        ranked_ids = rankings[0]
+    
+    # Questions on the same topic share chunks, so one fetch covers the whole batch
+    unique_ids = list(dict.fromkeys(chunk_id for chunk_ids in ranked_ids for chunk_id in chunk_ids))
+    chunks = await timed(timings, "fetch", run_in_executor(io_executor, chunk_store.fetch_chunks, unique_ids), "batch")
+    chunks_by_id = {chunk["id"]: chunk for chunk in chunks}
+    
+    retrieved = [[chunks_by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks_by_id]
+                 for chunk_ids in ranked_ids]
+    
+    reranked = None
+    if reranker is not None:
+        reranked = await timed(timings, "rerank", rerank_candidates(
+            [questions[i] for i in misses], retrieved, top_k, started
+        ), "batch")
+    
+    for i, sources in zip(misses, reranked or retrieved):
+        results[i] = sources[:top_k]
+        # A first-stage fallback or a result missing a shard is not cached, so a later ask gets the full answer
+        if not partial and (reranker is None or reranked is not None):
+            query_cache.retrievals.set(keys[i], results[i])
+    return results
+
+async def retrieve_sources(question: str, top_k: int, mode: str, timings: Dict[str, float],
+                           filters: Dict = None) -> List[dict]:
+    started = time.perf_counter()
+    question_embedding = None
+    if mode != "lexical":
+        question_embedding = await timed(timings, "embed", embed_question(question))
+    
+    key = query_cache.retrieval_key(question_embedding, top_k, mode, question, filters)
+    sources = query_cache.retrievals.get(key)
+    if sources is not None:
+        return sources
+    
+    candidates, depth = candidate_depth(top_k, mode)
+    where = build_where(filters or {})
+    legs = []
+    # Filters go to both stores so they narrow the candidates before top-k, not after
+    if mode != "lexical":
+        legs.append(timed(timings, "vector_search",
+                          run_in_executor(io_executor, search_chunk_ids, question_embedding, depth, where)))
+    if mode != "dense":
+        legs.append(timed(timings, "lexical_search",
+                          run_in_executor(io_executor, chunk_store.search_lexical, question, depth, filters)))
+    rankings = await asyncio.gather(*legs)
+    partial = False
+    if mode != "lexical":
+        rankings[0], partial = rankings[0]
+    
+    chunk_ids = reciprocal_rank_fusion(rankings)[:candidates] if len(rankings) > 1 else rankings[0]
+    sources = await timed(timings, "fetch", run_in_executor(io_executor, chunk_store.fetch_chunks, chunk_ids))
     
-    return QueryResponse(answer=answer, sources=sources)
+    if reranker is not None and sources:
+        reranked = await timed(timings, "rerank", rerank_candidates([question], [sources], top_k, started))
+        if reranked is None:
+            # Over budget: answer from the first-stage order, uncached so a later ask is reranked
+            return sources[:top_k]
+        sources = reranked[0]
+    if not partial:
+        query_cache.retrievals.set(key, sources)
+    return sources
+
+async def pack_context(question: str, sources: List[dict]) -> Dict:
+    query_embedding = chunk_embeddings = None
+    if context_packer.mmr and len(sources) > 1:
+        # Both embeddings already exist: the question's is cached and the chunks' are in the vector store
+        query_embedding = await embed_question(question)
+        chunk_embeddings = await run_in_executor(
+            io_executor, fetch_chunk_embeddings, [source["id"] for source in sources]
+        )
+    
+    context = context_packer.pack(sources, query_embedding, chunk_embeddings)
+    stats = context["stats"]
+    stats["prompt_tokens_before"] = context_packer.estimate_tokens(
+        build_prompt(question, [source["content"] for source in sources])
+    )
+    stats["prompt_tokens_after"] = context_packer.estimate_tokens(build_prompt(question, context["texts"]))
+    metrics.PROMPT_TOKENS.inc(stats["prompt_tokens_before"], stage="retrieved")
+    metrics.PROMPT_TOKENS.inc(stats["prompt_tokens_after"], stage="packed")
+    return context
+
+async def generate_answer(prompt: str) -> str:
+    key = query_cache.answer_key(prompt)
+    answer = query_cache.answers.get(key)
+    if answer is None:
+        answer = await generation_client.generate(prompt)
+        query_cache.answers.set(key, answer)
+    return answer
+
+async def stream_answer(prompt: str) -> AsyncIterator[str]:
+    key = query_cache.answer_key(prompt)
+    answer = query_cache.answers.get(key)
+    if answer is not None:
+        yield answer
+        return
+    
+    parts = []
+    tokens = generation_client.stream(prompt)
+    try:
+        async for text in tokens:
+            parts.append(text)
+            yield text
+    finally:
+        await tokens.aclose()
+    query_cache.answers.set(key, "".join(parts))
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query", response_model=QueryResponse, dependencies=[Depends(require_ready)])
+async def query_documents(request: QueryRequest, response: Response):
+    started = time.perf_counter()
+    timings = {}
+    context = {"sources": [], "stats": {}}
+    try:
+        sources = await retrieve_sources(
+            request.question, request.top_k, request.mode, timings, filters_dict(request.filters)
+        )
+        
+        if sources:
+            context = await timed(timings, "pack", pack_context(request.question, sources))
+            prompt = build_prompt(request.question, context["texts"])
+            answer = await timed(timings, "generate", generate_answer(prompt))
+        else:
+            answer = NO_CONTEXT_ANSWER
+    except GENERATION_ERRORS as e:
+        record_query("query", request.mode, generation_status(e), started)
+        raise generation_unavailable(e)
+    except Exception:
+        record_query("query", request.mode, "error", started)
+        raise
+    
+    record_query("query", request.mode, "ok", started)
+    response.headers["Server-Timing"] = server_timing(timings)
+    return QueryResponse(answer=answer, sources=context["sources"], timings=timings, context=context["stats"])
+
+@app.post("/query/stream", dependencies=[Depends(require_ready)])
+async def stream_query_documents(request: QueryRequest, http_request: Request):
+    started = time.perf_counter()
+    timings = {}
+    context = {"texts": [], "sources": [], "stats": {}}
+    try:
+        sources = await retrieve_sources(
+            request.question, request.top_k, request.mode, timings, filters_dict(request.filters)
+        )
+        if sources:
+            context = await timed(timings, "pack", pack_context(request.question, sources))
+            # Shed before the 200 goes out; once streaming, overload can only be reported as an event
+            generation_client.check_capacity()
+    except GenerationOverloaded as e:
+        record_query("query_stream", request.mode, "shed", started)
+        raise generation_unavailable(e)
+    except Exception:
+        record_query("query_stream", request.mode, "error", started)
+        raise
+    
+    async def events():
+        yield sse_event("sources", {"sources": context["sources"], "timings": timings, "context": context["stats"]})
+        
+        if not context["texts"]:
+            yield sse_event("token", {"text": NO_CONTEXT_ANSWER})
+            yield sse_event("done", {})
+            record_query("query_stream", request.mode, "ok", started)
+            return
+        
+        tokens = stream_answer(build_prompt(request.question, context["texts"]))
+        generate_started = time.perf_counter()
+        status = "error"
+        try:
+            async for text in tokens:
+                # Stop pulling from the LLM as soon as the client goes away
+                if await http_request.is_disconnected():
+                    status = "disconnected"
+                    return
+                yield sse_event("token", {"text": text})
+            yield sse_event("done", {})
+            status = "ok"
+        except GENERATION_ERRORS as e:
+            status = generation_status(e)
+            yield sse_event("error", {"detail": str(e)})
+        except Exception as e:
+            # Headers are already sent, so a terminal event is the only way to tell the client to stop waiting
+            logger.exception("Streaming generation failed")
+            yield sse_event("error", {"detail": str(e) or type(e).__name__})
+        finally:
+            await tokens.aclose()
+            metrics.QUERY_STAGE_LATENCY.observe(time.perf_counter() - generate_started, stage="generate", scope="request")
+            record_query("query_stream", request.mode, status, started)
+    
+    # Only the retrieval stages are known before the body starts streaming
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": server_timing(timings)}
+    )
+
+@app.post("/query/batch", response_model=BatchQueryResponse, dependencies=[Depends(require_ready)])
+async def batch_query_documents(request: BatchQueryRequest, response: Response):
+    max_questions = int(os.getenv("BATCH_MAX_QUESTIONS", "256"))
+    if len(request.questions) > max_questions:
+        raise HTTPException(status_code=413, detail=f"At most {max_questions} questions per batch")
+    
+    started = time.perf_counter()
+    timings = {}
+    if not request.questions:
+        return BatchQueryResponse(results=[], timings=timings)
+    
+    try:
+        all_sources = await retrieve_sources_batch(
+            request.questions, request.top_k, request.mode, timings, filters_dict(request.filters)
+        )
+    except Exception:
+        record_query("query_batch", request.mode, "error", started)
+        raise
+    
+    results = [BatchQueryResult(question=question, sources=sources)
+               for question, sources in zip(request.questions, all_sources)]
+    
+    if request.generate:
+        slots = asyncio.Semaphore(int(os.getenv("BATCH_GENERATE_CONCURRENCY", "8")))
+        errors = []
+        
+        async def answer(result: BatchQueryResult):
+            if not result.sources:
+                result.answer = NO_CONTEXT_ANSWER
+                return
+            async with slots:
+                try:
+                    context = await pack_context(result.question, result.sources)
+                    result.sources = context["sources"]
+                    result.context = context["stats"]
+                    result.answer = await generate_answer(build_prompt(result.question, context["texts"]))
+                except Exception as e:
+                    # One failed generation should not throw away the rest of the batch
+                    result.error = str(e) or type(e).__name__
+                    errors.append(e)
+        
+        await timed(timings, "generate", asyncio.gather(*(answer(result) for result in results)), "batch")
+        generated = [result for result in results if result.sources]
+        if generated and len(errors) == len(generated) and all(isinstance(e, GENERATION_ERRORS) for e in errors):
+            # Nothing was answered, so report the generation status rather than a 200 full of errors
+            record_query("query_batch", request.mode, generation_status(errors[0]), started)
+            raise generation_unavailable(errors[0])
+    
+    record_query("query_batch", request.mode, "ok", started)
+    response.headers["Server-Timing"] = server_timing(timings)
+    return BatchQueryResponse(results=results, timings=timings)
+
+@app.get("/cache/stats", dependencies=[Depends(require_ready)])
+async def cache_stats():
+    return query_cache.stats()
+
+@app.post("/cache/clear", dependencies=[Depends(require_ready)])
+async def clear_cache():
+    query_cache.clear()
+    return {"status": "cleared"}
+
+def save_upload(upload: UploadFile, directory: str, max_bytes: int) -> str:
+    filename = os.path.basename(upload.filename or "")
+    if not filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only .pdf files can be ingested")
+    
+    partial_path = os.path.join(directory, f".{filename}.upload")
+    try:
+        with open(partial_path, "wb") as f:
+            size = 0
+            block = upload.file.read(1 << 20)
+            if not block.startswith(b"%PDF-"):
+                raise HTTPException(status_code=400, detail="File is not a PDF")
+            while block:
+                size += len(block)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Uploads are limited to {max_bytes} bytes")
+                f.write(block)
+                block = upload.file.read(1 << 20)
+        # Rescans and the directory watcher only ever see the complete file
+        os.replace(partial_path, os.path.join(directory, filename))
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return filename
+
+@app.post("/ingest/upload", status_code=202, dependencies=[Depends(require_ready)])
+async def upload_document(file: UploadFile = File(...)):
+    max_bytes = int(float(os.getenv("INGEST_MAX_UPLOAD_MB", "100")) * 2**20)
+    filename = await run_in_executor(io_executor, save_upload, file, pdf_directory(), max_bytes)
+    return await run_in_executor(io_executor, job_queue.enqueue, "file", filename)
+
+@app.post("/ingest/rescan", status_code=202, dependencies=[Depends(require_ready)])
+async def rescan_documents(force: bool = False):
+    # A forced rescan reprocesses every PDF, not only new and changed ones
+    return await run_in_executor(io_executor, job_queue.enqueue, "reprocess" if force else "rescan")
+
+@app.get("/ingest/jobs", dependencies=[Depends(require_ready)])
+async def list_jobs(limit: int = 20):
+    return await run_in_executor(io_executor, job_queue.recent, max(1, min(limit, 100)))
+
+@app.get("/ingest/jobs/{job_id}", dependencies=[Depends(require_ready)])
+async def job_status(job_id: int):
+    job = await run_in_executor(io_executor, job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    # Cache and batcher counters already exist; copy them in at scrape time instead of on every request
+    if ready:
+        for level, cache in (("embeddings", query_cache.embeddings), ("retrievals", query_cache.retrievals),
+                             ("answers", query_cache.answers), ("rerank_scores", query_cache.rerank_scores),
+                             ("chunk_embeddings", query_cache.chunk_embeddings)):
+            stats = cache.stats()
+            metrics.CACHE_HITS.set_total(stats["hits"], level=level)
+            metrics.CACHE_MISSES.set_total(stats["misses"], level=level)
+            metrics.CACHE_ENTRIES.set(stats["size"], level=level)
+        batcher_stats = embedding_batcher.stats()
+        metrics.EMBEDDING_BATCHES.set_total(batcher_stats["batches"])
+        metrics.EMBEDDING_BATCH_ITEMS.set_total(batcher_stats["items"])
+        generation_stats = generation_client.stats()
+        metrics.GENERATION_INFLIGHT.set(generation_stats["inflight"])
+        metrics.GENERATION_QUEUED.set(generation_stats["queued"])
+    for kind, value in metrics.process_memory().items():
+        metrics.PROCESS_MEMORY.set(value, kind=kind)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live")
+async def liveness():
+    if startup_error:
+        raise HTTPException(status_code=503, detail=startup_error)
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    if not ready:
+        raise HTTPException(status_code=503, detail=startup_error or "Service is starting")
+    return {"status": "ready", "startup_seconds": startup_timings, "memory_bytes": metrics.process_memory()}
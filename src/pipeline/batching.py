@@ -0,0 +1,110 @@
+import asyncio
+import os
+from concurrent.futures import Executor
+from typing import Callable, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class EmbeddingBatcher:
+    
+    def __init__(self, encode_batch: Callable[[List[str]], List[List[float]]], executor: Executor,
+                 max_batch_size: int = None, max_wait_ms: float = None, max_concurrent_batches: int = None):
+        self.encode_batch = encode_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "2"))) / 1000
+        self.max_concurrent_batches = max_concurrent_batches or int(os.getenv("EMBEDDING_WORKERS", "2"))
+        self.batches = 0
+        self.items = 0
+        self._queue = None
+        self._slots = None
+        self._task = None
+        self._inflight = set()
+    
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        while self._queue and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding batcher stopped"))
+    
+    async def encode(self, text: str) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def _collect(self) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        return batch
+    
+    async def _run(self):
+        # Requests that arrive while every slot is encoding accumulate into the next batch
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._encode(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+    
+    async def _encode(self, batch: List[tuple]):
+        try:
+            batch = [(text, future) for text, future in batch if not future.cancelled()]
+            if not batch:
+                return
+            
+            loop = asyncio.get_running_loop()
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.encode_batch, [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        finally:
+            self._slots.release()
+    
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0
+        }
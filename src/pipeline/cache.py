@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class TTLCache:
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: str, value: Any):
+        if self.maxsize <= 0 or value is None:
+            return
+        
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+class QueryCache:
+    
+    def __init__(self):
+        self.embeddings = TTLCache(
+            int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+        )
+        self.retrievals = TTLCache(
+            int(os.getenv("RETRIEVAL_CACHE_SIZE", "2000")),
+            float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+        )
+        self.answers = TTLCache(
+            int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+            float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        )
+        self.rerank_scores = TTLCache(
+            int(os.getenv("RERANK_CACHE_SIZE", "20000")),
+            float(os.getenv("RERANK_CACHE_TTL", "86400"))
+        )
+        self.chunk_embeddings = TTLCache(
+            int(os.getenv("CHUNK_EMBEDDING_CACHE_SIZE", "20000")),
+            float(os.getenv("CHUNK_EMBEDDING_CACHE_TTL", "86400"))
+        )
+        self.corpus_version = None
+    
+    def embedding_key(self, question: str) -> str:
+        return normalize_question(question)
+    
+    def retrieval_key(self, embedding: List[float], top_k: int, mode: str = "dense", question: str = "",
+                      filters: Dict = None) -> str:
+        digest = hashlib.sha1(array("f", embedding or []).tobytes())
+        if mode != "dense":
+            digest.update(normalize_question(question).encode("utf-8"))
+        if filters:
+            digest.update(json.dumps(filters, sort_keys=True).encode("utf-8"))
+        return f"{digest.hexdigest()}:{top_k}:{mode}"
+    
+    def answer_key(self, prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    
+    def rerank_key(self, question: str, chunk_id: str) -> str:
+        return f"{normalize_question(question)}\x00{chunk_id}"
+    
+    def sync_corpus_version(self, corpus_version: str) -> bool:
+        # Embeddings only depend on the model, and chunk IDs change with chunk content and model, so rerank
+        # scores and chunk embeddings survive corpus changes too
+        if corpus_version == self.corpus_version:
+            return False
+        
+        if self.corpus_version is not None:
+            self.retrievals.clear()
+            self.answers.clear()
+        self.corpus_version = corpus_version
+        return True
+    
+    def clear(self):
+        self.embeddings.clear()
+        self.retrievals.clear()
+        self.answers.clear()
+        self.rerank_scores.clear()
+        self.chunk_embeddings.clear()
+    
+    def stats(self) -> Dict:
+        return {
+            "corpus_version": self.corpus_version,
+            "embeddings": self.embeddings.stats(),
+            "retrievals": self.retrievals.stats(),
+            "answers": self.answers.stats(),
+            "rerank_scores": self.rerank_scores.stats(),
+            "chunk_embeddings": self.chunk_embeddings.stats()
+        }
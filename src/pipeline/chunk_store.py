@@ -0,0 +1,130 @@
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def filter_conditions(filters: Dict) -> Tuple[List[str], List]:
+    conditions, params = [], []
+    if filters.get("filename"):
+        conditions.append("paper_filename = %s")
+        params.append(filters["filename"])
+    if filters.get("section_title"):
+        # Long sections are stored as "<title> (Part n)"; match the title and all of its parts
+        escaped = filters["section_title"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("(section_title = %s OR section_title LIKE %s)")
+        params.extend([filters["section_title"], f"{escaped} (Part %"])
+    if filters.get("page_from") is not None:
+        conditions.append("page_end >= %s")
+        params.append(filters["page_from"])
+    if filters.get("page_to") is not None:
+        conditions.append("page_num <= %s")
+        params.append(filters["page_to"])
+    return conditions, params
+
+class ChunkStore:
+    
+    def __init__(self, min_connections: int = None, max_connections: int = None, max_retries: int = None):
+        self.min_connections = min_connections or int(os.getenv("PG_POOL_MIN", "1"))
+        self.max_connections = max_connections or int(os.getenv("PG_POOL_SIZE", "10"))
+        self.max_retries = max_retries or int(os.getenv("PG_MAX_RETRIES", "2"))
+        self.pool = None
+        # ThreadedConnectionPool raises instead of blocking when exhausted
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+    
+    def connect(self):
+        self.pool = ThreadedConnectionPool(
+            self.min_connections,
+            self.max_connections,
+            host=os.getenv("DB_HOST", "postgres_db"),
+            database=os.getenv("DB_NAME", "ragdb"),
+            user=os.getenv("DB_USER", "raguser"),
+            password=os.getenv("DB_PASSWORD", "ragpass")
+        )
+    
+    def close(self):
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
+    
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            conn = self.pool.getconn()
+            if conn.closed:
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+            
+            broken = False
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                if not broken and not conn.closed:
+                    conn.rollback()
+                self.pool.putconn(conn, close=broken or bool(conn.closed))
+    
+    def fetch_all(self, query: str, params: tuple = None) -> List[tuple]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(query, params)
+                        return cur.fetchall()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt == self.max_retries:
+                    raise
+    
+    def fetch_chunks(self, chunk_ids: List[str]) -> List[Dict]:
+        if not chunk_ids:
+            return []
+        
+        rows = self.fetch_all(
+            "SELECT id, paper_filename, section_title, chunk_text, chunk_index, page_num, page_end FROM chunks WHERE id = ANY(%s)",
+            (list(chunk_ids),)
+        )
+        rows_by_id = {row[0]: row for row in rows}
+        
+        chunks = []
+        for chunk_id in chunk_ids:
+            row = rows_by_id.get(chunk_id)
+            if row:
+                chunks.append({
+                    "id": row[0],
+                    "filename": row[1],
+                    "title": row[2],
+                    "content": row[3],
+                    "chunk_index": row[4],
+                    "page_num": row[5],
+                    "page_end": row[6]
+                })
+        return chunks
+    
+    def search_lexical(self, question: str, limit: int, filters: Dict = None) -> List[str]:
+        conditions, params = filter_conditions(filters or {})
+        
+        # OR the query terms together so one rare exact term is enough to match
+        rows = self.fetch_all(f"""
+            SELECT id
+            FROM chunks, to_tsquery('english', replace(plainto_tsquery('english', %s)::text, '&', '|')) AS query
+            WHERE search_vector @@ query{"".join(f" AND {condition}" for condition in conditions)}
+            ORDER BY ts_rank_cd(search_vector, query) DESC
+            LIMIT %s
+        """, (question, *params, limit))
+        return [row[0] for row in rows]
+    
+    def corpus_version(self) -> str:
+        rows = self.fetch_all("""
+            SELECT md5(string_agg(
+                filename || ':' || COALESCE(content_hash, '') || ':' || processed_at::text,
+                ',' ORDER BY filename
+            ))
+            FROM documents
+        """)
+        return rows[0][0] or ""
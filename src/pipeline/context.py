@@ -0,0 +1,110 @@
+import math
+import os
+from collections import defaultdict
+from typing import List, Dict
+from dotenv import load_dotenv
+from .retrieval import maximal_marginal_relevance
+
+load_dotenv()
+
+def join_overlapping(left: str, right: str, min_overlap: int = 32) -> str:
+    # Neighbouring chunks share up to CHUNK_OVERLAP characters: the tail of one is the head of the next
+    if right in left:
+        return left
+    
+    probe = right[:min_overlap]
+    position = left.find(probe, max(len(left) - len(right), 0))
+    while position != -1:
+        if right.startswith(left[position:]):
+            return left + right[len(left) - position:]
+        position = left.find(probe, position + 1)
+    # The splitter cuts at separators, so a neighbour can start with the punctuation that ended a sentence
+    return left + right if right[:1] in ".,;:" else f"{left} {right}"
+
+class ContextPacker:
+    
+    def __init__(self, token_budget: int = None, chars_per_token: float = None,
+                 mmr: bool = None, mmr_lambda: float = None):
+        self.token_budget = token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        self.chars_per_token = chars_per_token or float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+        self.mmr = mmr if mmr is not None else os.getenv("CONTEXT_MMR", "false").lower() == "true"
+        self.mmr_lambda = mmr_lambda if mmr_lambda is not None else float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+    
+    def estimate_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+    
+    def merge(self, chunks: List[Dict]) -> List[Dict]:
+        by_file = defaultdict(list)
+        for rank, chunk in enumerate(chunks):
+            by_file[chunk["filename"]].append((chunk.get("chunk_index"), rank, chunk))
+        
+        blocks = []
+        for entries in by_file.values():
+            entries.sort(key=lambda entry: (entry[0] is None, entry[0] or 0, entry[1]))
+            block = None
+            for chunk_index, rank, chunk in entries:
+                adjacent = block is not None and chunk_index is not None and block["last_index"] is not None \
+                    and chunk_index - block["last_index"] <= 1
+                if adjacent:
+                    block["text"] = join_overlapping(block["text"], chunk["content"])
+                    block["ids"].append(chunk["id"])
+                    block["rank"] = min(block["rank"], rank)
+                    block["last_index"] = chunk_index
+                else:
+                    block = {"text": chunk["content"], "ids": [chunk["id"]], "rank": rank, "last_index": chunk_index}
+                    blocks.append(block)
+        
+        # Short sections are stored as whole pages, so one block can contain another outright
+        blocks.sort(key=lambda block: (-len(block["text"]), block["rank"]))
+        kept = []
+        for block in blocks:
+            container = next((other for other in kept if block["text"] in other["text"]), None)
+            if container is None:
+                kept.append(block)
+            else:
+                container["ids"].extend(block["ids"])
+                container["rank"] = min(container["rank"], block["rank"])
+        
+        kept.sort(key=lambda block: block["rank"])
+        return kept
+    
+    def order(self, chunks: List[Dict], query_embedding: List[float] = None,
+              chunk_embeddings: Dict[str, List[float]] = None) -> List[Dict]:
+        if not self.mmr or query_embedding is None or not chunk_embeddings:
+            return chunks
+        
+        ranked = [chunk for chunk in chunks if chunk["id"] in chunk_embeddings]
+        unranked = [chunk for chunk in chunks if chunk["id"] not in chunk_embeddings]
+        order = maximal_marginal_relevance(
+            query_embedding, [chunk_embeddings[chunk["id"]] for chunk in ranked], self.mmr_lambda
+        )
+        return [ranked[i] for i in order] + unranked
+    
+    def pack(self, chunks: List[Dict], query_embedding: List[float] = None,
+             chunk_embeddings: Dict[str, List[float]] = None) -> Dict:
+        selected = []
+        blocks = []
+        for chunk in self.order(chunks, query_embedding, chunk_embeddings):
+            candidate = self.merge(selected + [chunk])
+            tokens = sum(self.estimate_tokens(block["text"]) for block in candidate)
+            if tokens <= self.token_budget:
+                selected.append(chunk)
+                blocks = candidate
+            elif not selected:
+                # Never send an empty context because the best chunk alone is over budget
+                max_chars = int(self.token_budget * self.chars_per_token)
+                selected.append(chunk)
+                blocks = [dict(candidate[0], text=chunk["content"][:max_chars])]
+        
+        used_ids = {chunk_id for block in blocks for chunk_id in block["ids"]}
+        return {
+            "texts": [block["text"] for block in blocks],
+            "sources": [chunk for chunk in chunks if chunk["id"] in used_ids],
+            "stats": {
+                "chunks_before": len(chunks),
+                "chunks_after": len(used_ids),
+                "blocks": len(blocks),
+                "context_tokens_before": sum(self.estimate_tokens(chunk["content"]) for chunk in chunks),
+                "context_tokens_after": sum(self.estimate_tokens(block["text"]) for block in blocks)
+            }
+        }
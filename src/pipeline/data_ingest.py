@@ -1,18 +1,45 @@
 import fitz
+import bisect
+import collections
+import hashlib
+import logging
 import os
-from typing import List, Dict, Tuple
+import time
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Dict, Tuple, Iterable, Iterator, Optional
 from dotenv import load_dotenv
 import re
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+HEADING_NUMBERING = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[A-Z](?:\.\d+)*\.?|[IVX]+\.)\s+\S")
+SECTION_NUMBERING = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+\S")
+CAPTION = re.compile(r"^(?:fig(?:ure)?|table|algorithm|listing)\.?\s*\d", re.IGNORECASE)
+ALNUM = re.compile(r"[A-Za-z0-9]")
+LETTERS = re.compile(r"[A-Za-z]{2}")
+FRONT_MATTER_HEADINGS = {"abstract", "introduction"}
+FONT_ITALIC = 2
+FONT_BOLD = 16
+# Bump when extraction, segmentation or chunking changes its output, so stored documents are re-chunked
+PIPELINE_VERSION = 3
+
 class PDFProcessor:
     
     def __init__(self, chunk_size: int = None, chunk_overlap: int = None, max_section_size: int = None):
         self.chunk_size = chunk_size or int(os.getenv("CHUNK_SIZE", "1000"))
         self.chunk_overlap = chunk_overlap or int(os.getenv("CHUNK_OVERLAP", "200"))
         self.max_section_size = max_section_size or int(os.getenv("MAX_SECTION_SIZE", "3000"))
+        self.streaming_min_pages = int(os.getenv("PDF_STREAMING_MIN_PAGES", "200"))
+        self.heading_size_ratio = float(os.getenv("PDF_HEADING_SIZE_RATIO", "1.15"))
+        self.heading_max_chars = int(os.getenv("PDF_HEADING_MAX_CHARS", "100"))
+        self.section_buffer_chars = max(
+            int(os.getenv("PDF_SECTION_BUFFER_CHARS", "1000000")), self.max_section_size
+        )
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
@@ -21,202 +48,385 @@ class PDFProcessor:
             separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""]
         )
     
+    @property
+    def fingerprint(self) -> str:
+        # Every setting that changes chunk text or boundaries; the page streaming threshold does not
+        return f"v{PIPELINE_VERSION}:{self.chunk_size}:{self.chunk_overlap}:{self.max_section_size}:" \
+               f"{self.heading_size_ratio}:{self.heading_max_chars}:{self.section_buffer_chars}"
+    
     def extract_text_from_pdf(self, pdf_path: str) -> List[Dict[str, str]]:
-        doc = fitz.open(pdf_path)
         pages_text = []
+        current_section = "Abstract"
+        
+        for page_data in self.iter_pages(pdf_path):
+            page_data["section_title"] = page_data["headings"][0][1] if page_data["headings"] else current_section
+            if page_data["headings"]:
+                current_section = page_data["headings"][-1][1]
+            pages_text.append(page_data)
         
+        return pages_text
+    
+    def iter_pages(self, pdf_path: str) -> Iterator[Dict[str, str]]:
+        with fitz.open(pdf_path) as doc:
+            yield from self._iter_document_pages(doc)
+    
+    def _iter_document_pages(self, doc) -> Iterator[Dict[str, str]]:
+        # Each page's layout is read once; body size is learned as the document goes, so no page is rescanned
+        font_sizes = collections.Counter()
+        title_size = 0.0
+        front_matter = True
         for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text()
-            text = self._clean_text(text)
+            text, candidates = self._page_layout(doc.load_page(page_num), font_sizes)
+            
+            headings = []
+            for offset, title, size, numbered, above in candidates:
+                # Above the first paragraph a lone letter is more likely "A Survey ..." or "J. Doe" than numbering
+                sectioned = numbered and (above is None or bool(SECTION_NUMBERING.match(title)))
+                front_matter = front_matter and page_num == 0 and not sectioned
+                # Author, email and affiliation lines are set large too; on the title page only the title and a
+                # few known headings count until numbered sections begin. Above the first paragraph the title
+                # is the first candidate with nothing set larger above it, even when it is too long to be one
+                if front_matter and title.lower() not in FRONT_MATTER_HEADINGS and (
+                        size < title_size or above is not None and (headings or size < above)):
+                    continue
+                title_size = max(title_size, size) if front_matter else title_size
+                headings.append((offset, title))
             
             if text.strip():
-                pages_text.append({
-                    "page_num": page_num + 1,
-                    "text": text,
-                    "section_title": self._extract_section_title(text)
-                })
+                yield {"page_num": page_num + 1, "text": text, "headings": headings}
+    
+    def _page_layout(self, page, font_sizes: collections.Counter
+                     ) -> Tuple[str, List[Tuple[int, str, float, bool, Optional[float]]]]:
+        blocks = []
+        for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+            lines = block.get("lines", [])
+            line_texts = []
+            block_size = 0.0
+            for line in lines:
+                if not line["spans"]:
+                    continue
+                line_text = "".join(span["text"] for span in line["spans"])
+                # Weighted by line rather than by span: body size is the mode, and lines are far fewer
+                font_sizes[round(line["spans"][0]["size"] * 2) / 2] += len(line_text)
+                line_texts.append(line_text)
+                block_size = max(block_size, line["spans"][0]["size"])
+            text = " ".join(" ".join(line_texts).split())
+            if text:
+                blocks.append((text, lines, block_size))
         
-        doc.close()
-        return pages_text
+        body_size = max(font_sizes, key=font_sizes.get) if font_sizes else 0.0
+        candidates = []
+        offset = 0
+        # Largest text above each candidate until the first body-size paragraph, None below it
+        above = 0.0
+        for text, lines, block_size in blocks:
+            # Paragraphs are ruled out by length before any of their spans are looked at
+            heading = self._block_heading(text, lines, body_size) if len(text) <= self.heading_max_chars else None
+            if heading:
+                candidates.append((offset, *heading, above))
+            elif above is not None and round(block_size * 2) / 2 == body_size:
+                above = None
+            if above is not None:
+                above = max(above, block_size)
+            offset += len(text) + 1
+        
+        return " ".join(text for text, _, _ in blocks), candidates
     
-    def _clean_text(self, text: str) -> str:
-        text = re.sub(r'\s+', ' ', text)
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if len(line) > 10:
-                cleaned_lines.append(line)
-        
-        return ' '.join(cleaned_lines)
-    
-    def _extract_section_title(self, text: str) -> str:
-        numbered_pattern = r'\b(\d+\s+[A-Z][a-zA-Z\s]+?)(?=\s+[a-z]|\s+[A-Z][a-z]|\s+[A-Z]{2,}|\s+[0-9]|\s+[^\w\s]|$)'
-        numbered_matches = re.findall(numbered_pattern, text)
-        if numbered_matches:
-            for match in numbered_matches:
-                if len(match.strip()) > 5 and len(match.strip()) < 100:
-                    return match.strip()
-        
-        subsection_pattern = r'\b(\d+\.\d+\s+[A-Z][a-zA-Z\s]+?)(?=\s+[a-z]|\s+[A-Z][a-z]|\s+[A-Z]{2,}|\s+[0-9]|\s+[^\w\s]|$)'
-        subsection_matches = re.findall(subsection_pattern, text)
-        if subsection_matches:
-            for match in subsection_matches:
-                if len(match.strip()) > 5 and len(match.strip()) < 100:
-                    return match.strip()
-        
-        section_keywords = [
-            'abstract', 'introduction', 'related work', 'background', 
-            'methodology', 'method', 'approach', 'model', 'architecture',
-            'experiments', 'results', 'evaluation', 'analysis',
-            'discussion', 'conclusion', 'future work', 'limitations',
-            'acknowledgments', 'references', 'appendix', 'scope',
-            'scaling', 'prediction', 'capabilities', 'training',
-            'attention', 'transformer', 'encoder', 'decoder'
-        ]
-        
-        text_lower = text.lower()
-        for keyword in section_keywords:
-            if keyword in text_lower:
-                lines = text.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if keyword in line.lower() and len(line) > 5 and len(line) < 100:
-                        return line
-        
-        return "Content"
-    
-    def _detect_all_sections(self, text: str) -> List[str]:
-        sections = []
-        
-        numbered_pattern = r'\b(\d+\s+[A-Z][a-zA-Z\s]+?)(?=\s+[a-z]|\s+[A-Z][a-z]|\s+[A-Z]{2,}|\s+[0-9]|\s+[^\w\s]|$)'
-        numbered_matches = re.findall(numbered_pattern, text)
-        for match in numbered_matches:
-            if len(match.strip()) > 5 and len(match.strip()) < 100:
-                sections.append(match.strip())
-        
-        subsection_pattern = r'\b(\d+\.\d+\s+[A-Z][a-zA-Z\s]+?)(?=\s+[a-z]|\s+[A-Z][a-z]|\s+[A-Z]{2,}|\s+[0-9]|\s+[^\w\s]|$)'
-        subsection_matches = re.findall(subsection_pattern, text)
-        for match in subsection_matches:
-            if len(match.strip()) > 5 and len(match.strip()) < 100:
-                sections.append(match.strip())
-        
-        sections = list(set(sections))
-        sections.sort()
-        
-        return sections
-    
-    def _find_page_for_chunk(self, chunk_text: str, section_pages: List[Dict[str, str]]) -> int:
-        best_page = section_pages[0]["page_num"] if section_pages else 1
-        max_overlap = 0
+    def _block_heading(self, text: str, lines: List[Dict], body_size: float) -> Optional[Tuple[str, float, bool]]:
+        if len(text.split()) > 12 or text.endswith((".", ",", ";", ":")):
+            return None
+        if CAPTION.match(text) or not LETTERS.search(text):
+            return None
         
-        for page_data in section_pages:
-            page_text = page_data["text"]
-            chunk_words = set(chunk_text.lower().split())
-            page_words = set(page_text.lower().split())
-            overlap = len(chunk_words.intersection(page_words))
-            
-            if overlap > max_overlap:
-                max_overlap = overlap
-                best_page = page_data["page_num"]
+        # Bullets and rules carry no style worth judging a heading by
+        spans = [span for line in lines for span in line["spans"] if ALNUM.search(span["text"])]
+        if not spans or any(line["dir"] != (1.0, 0.0) for line in lines):
+            return None
         
-        return best_page
+        size = min(span["size"] for span in spans)
+        numbered = bool(HEADING_NUMBERING.match(text))
+        if size >= body_size * self.heading_size_ratio:
+            return text, size, numbered
+        
+        # At body size only a numbered line set in bold, italics or capitals reads as a heading, which keeps
+        # bold author names and run-in paragraph labels out; small capitals are judged by their largest letter
+        emphasised = all(span["flags"] & (FONT_BOLD | FONT_ITALIC) for span in spans) or text.upper() == text
+        if numbered and emphasised and max(span["size"] for span in spans) >= body_size * 0.95:
+            return text, size, numbered
+        return None
     
-    def _find_section_for_page(self, page_text: str, detected_sections: List[str], current_section: str) -> str:
-        for line in page_text.split('\n'):
-            line = line.strip()
-            if line in detected_sections:
-                return line
+    def _join_pages(self, section_pages: List[Dict[str, str]]) -> Tuple[str, List[int]]:
+        page_starts = []
+        offset = 0
+        for page_data in section_pages:
+            page_starts.append(offset)
+            offset += len(page_data["text"]) + 1
         
-        for section in detected_sections:
-            if section.lower() in page_text.lower():
-                return section
+        return " ".join(page["text"] for page in section_pages), page_starts
+    
+    def _locate_chunks(self, section_text: str, section_chunks: List[str]) -> List[Tuple[int, int]]:
+        spans = []
+        cursor = 0
+        for chunk_text in section_chunks:
+            start = section_text.find(chunk_text, cursor)
+            if start < 0:
+                start = cursor
+            spans.append((start, start + len(chunk_text)))
+            cursor = start + 1
         
-        return current_section
-
-    def _group_pages_by_section(self, pages_text: List[Dict[str, str]]) -> Dict[str, List[Dict[str, str]]]:
-        sections = {}
-        current_section = "Abstract"
+        return spans
+    
+    def _page_range_for_span(self, start: int, end: int, page_starts: List[int],
+                             section_pages: List[Dict[str, str]]) -> Tuple[int, int]:
+        first = max(bisect.bisect_right(page_starts, start) - 1, 0)
+        last = max(bisect.bisect_right(page_starts, max(start, end - 1)) - 1, first)
+        return section_pages[first]["page_num"], section_pages[last]["page_num"]
     
-        all_text = " ".join([page["text"] for page in pages_text])
-        detected_sections = self._detect_all_sections(all_text)
+    def _chunk_section(self, section_title: str, section_pages: List[Dict[str, str]], chunk_index: int,
+                       part: int = 0) -> List[Dict[str, str]]:
+        chunks = []
+        section_text, page_starts = self._join_pages(section_pages)
         
-        for page_data in pages_text:
-            page_text = page_data["text"]
-            page_num = page_data["page_num"]
-            
-            page_section = self._find_section_for_page(page_text, detected_sections, current_section)
+        # A section already split by the streaming buffer keeps its "(Part n)" numbering to the end
+        if part or len(section_text) > self.max_section_size:
+            section_chunks = self.text_splitter.split_text(section_text)
+            spans = self._locate_chunks(section_text, section_chunks)
             
-            if page_section != "Content":
-                current_section = page_section
-            
-            if page_section not in sections:
-                sections[page_section] = []
-            sections[page_section].append(page_data)
+            for i, (chunk_text, (start, end)) in enumerate(zip(section_chunks, spans)):
+                page_num, page_end = self._page_range_for_span(start, end, page_starts, section_pages)
+                
+                chunks.append({
+                    "text": chunk_text.strip(),
+                    "chunk_index": chunk_index,
+                    "page_num": page_num,
+                    "page_end": page_end,
+                    "section_title": f"{section_title} (Part {part+i+1})",
+                    "section": section_title
+                })
+                chunk_index += 1
+        else:
+            for page_data in section_pages:
+                chunks.append({
+                    "text": page_data["text"].strip(),
+                    "chunk_index": chunk_index,
+                    "page_num": page_data["page_num"],
+                    "page_end": page_data["page_num"],
+                    "section_title": section_title,
+                    "section": section_title
+                })
+                chunk_index += 1
         
-        return sections
-
+        return chunks
+    
     def chunk_text(self, pages_text: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        chunks = []
+        return [chunk for section_chunks in self._iter_sections(pages_text) for chunk in section_chunks]
+    
+    def iter_chunks(self, pdf_path: str) -> Iterator[Dict[str, str]]:
+        for chunks, _ in self.iter_chunk_batches(pdf_path):
+            yield from chunks
+    
+    def iter_chunk_batches(self, pdf_path: str) -> Iterator[Tuple[List[Dict[str, str]], int]]:
+        # One open serves the page count and the text; a short PDF comes back as a single batch
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+            if page_count < self.streaming_min_pages:
+                yield self.chunk_text(self._iter_document_pages(doc)), page_count
+                return
+            
+            # A section is chunked as soon as the next heading starts, so only its pages are held in memory, and
+            # sections leave in batches of up to PDF_SECTION_BUFFER_CHARS; the last batch may be empty
+            batch, batch_chars = [], 0
+            for section_chunks in self._iter_sections(self._iter_document_pages(doc), self.section_buffer_chars):
+                batch.extend(section_chunks)
+                batch_chars += sum(len(chunk["text"]) for chunk in section_chunks)
+                if batch_chars >= self.section_buffer_chars:
+                    yield batch, page_count
+                    batch, batch_chars = [], 0
+            yield batch, page_count
+    
+    def _split_page(self, page_data: Dict[str, str], current_section: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+        # Headings carry offsets into the page text, so a page is cut where each section starts
+        text = page_data["text"]
+        start = 0
+        for offset, title in page_data.get("headings", []):
+            yield current_section, {"page_num": page_data["page_num"], "text": text[start:offset].strip()}
+            current_section, start = title, offset
+        yield current_section, {"page_num": page_data["page_num"], "text": text[start:].strip()}
+    
+    def _iter_sections(self, pages: Iterable[Dict[str, str]],
+                       buffer_chars: int = None) -> Iterator[List[Dict[str, str]]]:
+        current_section = "Abstract"
+        section_pages = []
+        buffered_chars = 0
+        part = 0
         chunk_index = 0
         
-        sections = self._group_pages_by_section(pages_text)
-        
-        for section_title, section_pages in sections.items():
-            if len(" ".join([page["text"] for page in section_pages])) > self.max_section_size:
-                section_text = " ".join([page["text"] for page in section_pages])
-                section_chunks = self.text_splitter.split_text(section_text)
+        for page_data in pages:
+            for section, piece in self._split_page(page_data, current_section):
+                if section != current_section:
+                    # A heading directly followed by a subheading has no text of its own, so it leads the next section
+                    if not (len(section_pages) == 1 and section_pages[0]["text"] == current_section):
+                        if section_pages:
+                            section_chunks = self._chunk_section(current_section, section_pages, chunk_index, part)
+                            yield section_chunks
+                            chunk_index += len(section_chunks)
+                        section_pages, buffered_chars = [], 0
+                    current_section, part = section, 0
                 
-                for i, chunk_text in enumerate(section_chunks):
-                    chunk_page_num = self._find_page_for_chunk(chunk_text, section_pages)
-                    
-                    chunks.append({
-                        "text": chunk_text.strip(),
-                        "chunk_index": chunk_index,
-                        "page_num": chunk_page_num,
-                        "section_title": f"{section_title} (Part {i+1})"
-                    })
-                    chunk_index += 1
-            else:
-                for page_data in section_pages:
-                    chunks.append({
-                        "text": page_data["text"].strip(),
-                        "chunk_index": chunk_index,
-                        "page_num": page_data["page_num"],
-                        "section_title": section_title
-                    })
-                    chunk_index += 1
+                if not piece["text"]:
+                    continue
+                section_pages.append(piece)
+                buffered_chars += len(piece["text"])
+                if buffer_chars and buffered_chars > buffer_chars:
+                    # Memory ceiling: chunk what is buffered now and continue the section in a new part
+                    section_chunks = self._chunk_section(current_section, section_pages, chunk_index, part)
+                    yield section_chunks
+                    chunk_index += len(section_chunks)
+                    part += len(section_chunks)
+                    section_pages, buffered_chars = [], 0
         
-        return chunks
+        if section_pages:
+            yield self._chunk_section(current_section, section_pages, chunk_index, part)
+    
+    def extract_chunks(self, pdf_path: str) -> Tuple[List[Dict[str, str]], int]:
+        chunks, page_count = [], 0
+        for batch, page_count in self.iter_chunk_batches(pdf_path):
+            chunks.extend(batch)
+        return chunks, page_count
     
     def process_pdf(self, pdf_path: str) -> Tuple[str, List[Dict[str, str]]]:
         filename = os.path.basename(pdf_path)
-        pages_text = self.extract_text_from_pdf(pdf_path)
-        chunks = self.chunk_text(pages_text)
+        chunks, _ = self.extract_chunks(pdf_path)
         
         for chunk in chunks:
             chunk["filename"] = filename
         
         return filename, chunks
 
-def process_all_pdfs(pdf_directory: str) -> Dict[str, List[Dict[str, str]]]:
-    processor = PDFProcessor()
-    all_documents = {}
+def compute_file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def list_pdf_files(pdf_directory: str) -> List[str]:
+    return sorted(f for f in os.listdir(pdf_directory) if f.lower().endswith('.pdf'))
+
+_worker_processor = None
+_worker_batches = None
+
+def _init_pdf_worker(batches):
+    global _worker_processor, _worker_batches
+    _worker_processor = PDFProcessor()
+    _worker_batches = batches
+    # Batches left unread when the parent stops early must not keep the worker from exiting
+    batches.cancel_join_thread()
+
+def _process_pdf_worker(pdf_path: str):
+    started = time.perf_counter()
+    waited = 0.0
+    filename = os.path.basename(pdf_path)
+    previous, page_count = None, 0
+    
+    for chunks, page_count in _worker_processor.iter_chunk_batches(pdf_path):
+        for chunk in chunks:
+            chunk["filename"] = filename
+        if previous is not None:
+            put_started = time.perf_counter()
+            _worker_batches.put((filename, previous, None))
+            waited += time.perf_counter() - put_started
+        previous = chunks
     
-    pdf_files = [f for f in os.listdir(pdf_directory) if f.lower().endswith('.pdf')]
+    # The last batch carries the page count and parse time, which leaves out time blocked on a full queue
+    _worker_batches.put((filename, previous or [], (page_count, time.perf_counter() - started - waited)))
+
+def iter_processed_batches(pdf_directory: str, pdf_files: List[str] = None, max_workers: int = None,
+                           max_pending: int = None, on_error: Callable[[str, Exception], None] = None
+                           ) -> Iterator[Tuple[str, List[Dict[str, str]], Optional[Tuple[int, float]]]]:
+    max_workers = max_workers or int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+    max_pending = max_pending or int(os.getenv("INGEST_MAX_PENDING", str(max_workers * 2)))
     
+    if pdf_files is None:
+        pdf_files = list_pdf_files(pdf_directory)
     if not pdf_files:
-        return all_documents
+        return
+    
+    pdf_paths = iter(os.path.join(pdf_directory, f) for f in pdf_files)
     
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(pdf_directory, pdf_file)
+    # spawn keeps the parent's torch threads out of the parsing workers
+    context = multiprocessing.get_context("spawn")
+    # Workers block once this many batches are waiting, so a streamed PDF is never held whole on either side
+    batches = context.Queue(maxsize=max_pending)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_pdf_worker, initargs=(batches,),
+                             mp_context=context) as executor:
+        pending = {}
+        failed = set()
+        
+        def submit_next():
+            pdf_path = next(pdf_paths, None)
+            if pdf_path:
+                pending[os.path.basename(pdf_path)] = executor.submit(_process_pdf_worker, pdf_path)
+        
+        for _ in range(max_pending):
+            submit_next()
+        
         try:
-            filename, chunks = processor.process_pdf(pdf_path)
-            all_documents[filename] = chunks
-        except Exception:
+            while pending:
+                try:
+                    filename, chunks, parsed = batches.get(timeout=0.5)
+                except queue.Empty:
+                    filename = None
+                
+                if filename is not None and filename not in failed:
+                    yield filename, chunks, parsed
+                    if parsed is not None:
+                        pending.pop(filename)
+                        submit_next()
+                
+                # A worker that raised, or died, sends no last batch; batches it already sent are dropped
+                for failed_name, future in list(pending.items()):
+                    if not future.done() or future.exception() is None:
+                        continue
+                    pending.pop(failed_name)
+                    failed.add(failed_name)
+                    logger.error("Failed to parse %s: %s", failed_name, future.exception())
+                    if on_error:
+                        on_error(failed_name, future.exception())
+                    submit_next()
+        finally:
+            for future in pending.values():
+                future.cancel()
+            # Workers blocked on a full queue only finish once it drains
+            while not all(future.done() for future in pending.values()):
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+def iter_processed_pdfs(pdf_directory: str, pdf_files: List[str] = None, max_workers: int = None,
+                        max_pending: int = None, on_error: Callable[[str, Exception], None] = None
+                        ) -> Iterator[Tuple[str, List[Dict[str, str]], int, float]]:
+    # Whole documents, for callers that need every chunk of one at once
+    streamed = {}
+    
+    def drop_failed(filename: str, error: Exception):
+        streamed.pop(filename, None)
+        if on_error:
+            on_error(filename, error)
+    
+    for filename, chunks, parsed in iter_processed_batches(pdf_directory, pdf_files, max_workers, max_pending,
+                                                           drop_failed):
+        if parsed is None:
+            streamed.setdefault(filename, []).extend(chunks)
             continue
+        yield (filename, streamed.pop(filename, []) + chunks, *parsed)
+
+def process_all_pdfs(pdf_directory: str) -> Dict[str, List[Dict[str, str]]]:
+    all_documents = {}
+    
+    for filename, chunks, _, _ in iter_processed_pdfs(pdf_directory):
+        all_documents[filename] = chunks
     
     return all_documents
 
@@ -1,169 +1,547 @@
 
 import psycopg2
-import chromadb
+from psycopg2.extras import execute_values
+import hashlib
+import logging
 import os
+import queue
+import threading
+import time
 import uuid
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from contextlib import nullcontext
+from typing import List, Dict, Tuple
 from dotenv import load_dotenv
-from .data_ingest import process_all_pdfs
+from .data_ingest import PDFProcessor, iter_processed_batches, compute_file_hash, list_pdf_files
+from .embeddings import EmbeddingBackend
+from .embedding_cache import EmbeddingCache
+from .vector_index import LocalVectorIndex
+from .sharding import ChromaShards
+from . import metrics
 
 load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class IngestStats:
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = {
+            "parse": {"items": 0, "seconds": 0.0},
+            "embed": {"items": 0, "seconds": 0.0},
+            "store": {"items": 0, "seconds": 0.0}
+        }
+        self.planned = 0
+        self.documents = 0
+        self.pages = 0
+        self.failures = 0
+        self.failures_by_stage = {}
+        self.failed_documents = []
+        self.skipped = 0
+        self.removed = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+    
+    def record(self, stage: str, items: int, seconds: float):
+        with self._lock:
+            self.stages[stage]["items"] += items
+            self.stages[stage]["seconds"] += seconds
+        metrics.INGEST_STAGE_LATENCY.observe(seconds, stage=stage)
+    
+    def record_document(self, result: str = "ingested", count: int = 1):
+        with self._lock:
+            if result == "ingested":
+                self.documents += count
+            elif result == "skipped":
+                self.skipped += count
+            elif result == "removed":
+                self.removed += count
+        if count:
+            metrics.INGEST_DOCUMENTS.inc(count, result=result)
+    
+    def record_failure(self, stage: str, filename: str, error: Exception):
+        with self._lock:
+            self.failures += 1
+            self.failures_by_stage[stage] = self.failures_by_stage.get(stage, 0) + 1
+            self.failed_documents.append((filename, stage, str(error)))
+        metrics.INGEST_FAILURES.inc(stage=stage)
+    
+    def record_embedding_cache(self, hits: int, misses: int):
+        self.cache_hits += hits
+        self.cache_misses += misses
+        metrics.INGEST_EMBEDDING_CACHE.inc(hits, result="hit")
+        metrics.INGEST_EMBEDDING_CACHE.inc(misses, result="miss")
+    
+    def finish(self):
+        self.finished = time.perf_counter()
+    
+    def summary(self) -> str:
+        wall = (self.finished or time.perf_counter()) - self.started
+        lines = [
+            f"Ingested {self.documents} documents ({self.pages} pages, {self.failures} failed) in {wall:.1f}s; "
+            f"{self.skipped} unchanged, {self.removed} removed"
+        ]
+        lookups = self.cache_hits + self.cache_misses
+        if lookups:
+            lines.append(f"  embedding cache: {self.cache_hits} hits, {self.cache_misses} misses "
+                         f"({self.cache_hits / lookups:.0%} hit rate)")
+        units = {"parse": "pages", "embed": "chunks", "store": "chunks"}
+        for stage, totals in self.stages.items():
+            rate = totals["items"] / totals["seconds"] if totals["seconds"] else 0.0
+            failed = self.failures_by_stage.get(stage, 0)
+            lines.append(f"  {stage}: {totals['items']} {units[stage]} in {totals['seconds']:.1f}s busy ({rate:.1f} {units[stage]}/s), {failed} failed")
+        for filename, stage, error in self.failed_documents:
+            lines.append(f"  failed {stage} {filename}: {error}")
+        return "\n".join(lines)
+
 class DataProcessor:
     
     def __init__(self):
         self.model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-        self.model = None
+        self.vector_backend = os.getenv("VECTOR_BACKEND", "chroma")
+        self.pg_batch_size = int(os.getenv("PG_BATCH_SIZE", "500"))
+        self.chroma_batch_size = int(os.getenv("CHROMA_BATCH_SIZE", "256"))
+        self.queue_size = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+        self.embedding_threads = int(os.getenv("INGEST_EMBEDDING_THREADS", "0"))
+        self.use_embedding_cache = os.getenv("EMBEDDING_CACHE", "true").lower() == "true"
+        self.embedding_cache = None
+        self.defer_cleanup = False
+        self.pending_cleanup = {}
+        self.embedder = None
         self.pg_conn = None
-        self.chroma_client = None
-        self.chroma_collection = None
+        self.vector_store = None
+        self.vector_store_dirty = False
+        # Part of every stored document hash, so changing the chunker or the model reprocesses unchanged files
+        self.fingerprint = f"{PDFProcessor().fingerprint}|{EmbeddingBackend(self.model_name).cache_key}"
     
     def initialize_connections(self):
-        self.model = SentenceTransformer(self.model_name)
+        self.embedder = EmbeddingBackend(self.model_name, num_threads=self.embedding_threads or None).load()
         
+        if self.use_embedding_cache:
+            self.embedding_cache = EmbeddingCache(self.embedder.cache_key).connect()
+            pruned = self.embedding_cache.prune()
+            if pruned:
+                logger.info("Dropped %d cached embeddings from other models", pruned)
+        
+        self.connect_postgres()
+        
+        if self.vector_backend == "local":
+            self.vector_store = LocalVectorIndex().load(writable=True)
+        else:
+            self.vector_store = ChromaShards().connect()
+    
+    def connect_postgres(self):
         self.pg_conn = psycopg2.connect(
             host=os.getenv("DB_HOST", "localhost"),
             database=os.getenv("DB_NAME", "ragdb"),
             user=os.getenv("DB_USER", "raguser"),
             password=os.getenv("DB_PASSWORD", "ragpass")
         )
-        self.pg_conn.autocommit = True
+    
+    def ensure_connections(self):
+        # A long-running worker outlives Postgres restarts; a dead connection is replaced before the next run
+        try:
+            with self.pg_conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            self.pg_conn.rollback()
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            logger.warning("Postgres connection lost, reconnecting")
+            self.pg_conn.close()
+            self.connect_postgres()
         
-        self.chroma_client = chromadb.HttpClient(
-            host=os.getenv("CHROMA_HOST", "localhost"),
-            port=int(os.getenv("CHROMA_PORT", "8000"))
-        )
-        self.chroma_collection = self.chroma_client.get_collection("document_chunks")
+        if self.embedding_cache is not None:
+            try:
+                with self.embedding_cache.conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            except (psycopg2.InterfaceError, psycopg2.OperationalError):
+                self.embedding_cache.close()
+                self.embedding_cache.connect()
     
     def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        embeddings = self.model.encode(texts)
+        if self.embedding_cache is not None:
+            try:
+                return self.embedding_cache.encode(texts, self.embedder.encode).tolist()
+            except psycopg2.Error:
+                logger.warning("Embedding cache unavailable, encoding without it", exc_info=True)
+        embeddings = self.embedder.encode(texts)
         return embeddings.tolist()
     
-    def store_document_metadata(self, filename: str, file_path: str, total_chunks: int) -> int:
+    def store_document_metadata(self, filename: str, file_path: str, total_chunks: int,
+                                content_hash: str = None) -> int:
         cursor = self.pg_conn.cursor()
         
         cursor.execute("""
-            INSERT INTO documents (filename, file_path, total_chunks)
-            VALUES (%s, %s, %s)
+            INSERT INTO documents (filename, file_path, total_chunks, content_hash)
+            VALUES (%s, %s, %s, %s)
             ON CONFLICT (filename) 
             DO UPDATE SET 
                 file_path = EXCLUDED.file_path,
                 total_chunks = EXCLUDED.total_chunks,
+                content_hash = EXCLUDED.content_hash,
                 processed_at = CURRENT_TIMESTAMP
             RETURNING id
-        """, (filename, file_path, total_chunks))
+        """, (filename, file_path, total_chunks, content_hash))
         
         doc_id = cursor.fetchone()[0]
         cursor.close()
         return doc_id
     
-    def store_chunk_in_postgres(self, chunk_id: str, filename: str, section_title: str, 
-                               chunk_text: str, chunk_index: int):
+    def store_chunks_in_postgres(self, rows: List[tuple]):
         cursor = self.pg_conn.cursor()
         
-        cursor.execute("""
-            INSERT INTO chunks (id, paper_filename, section_title, chunk_text, chunk_index)
-            VALUES (%s, %s, %s, %s, %s)
+        execute_values(cursor, """
+            INSERT INTO chunks (id, paper_filename, section_title, chunk_text, chunk_index, page_num, page_end)
+            VALUES %s
             ON CONFLICT (id) 
             DO UPDATE SET 
                 paper_filename = EXCLUDED.paper_filename,
                 section_title = EXCLUDED.section_title,
                 chunk_text = EXCLUDED.chunk_text,
-                chunk_index = EXCLUDED.chunk_index
-        """, (chunk_id, filename, section_title, chunk_text, chunk_index))
+                chunk_index = EXCLUDED.chunk_index,
+                page_num = EXCLUDED.page_num,
+                page_end = EXCLUDED.page_end
+        """, rows, page_size=self.pg_batch_size)
         
         cursor.close()
     
-    def store_chunk_in_chromadb(self, chunk_id: str, embedding: List[float], metadata: Dict):
-        self.chroma_collection.upsert(
-            ids=[chunk_id],
-            embeddings=[embedding],
-            metadatas=[metadata]
-        )
+    def load_document_hashes(self) -> Dict[str, str]:
+        with self.pg_conn:
+            cursor = self.pg_conn.cursor()
+            cursor.execute("SELECT filename, content_hash FROM documents")
+            hashes = dict(cursor.fetchall())
+            cursor.close()
+        return hashes
+    
+    def document_hash(self, file_hash: str) -> str:
+        return hashlib.sha256(f"{file_hash}|{self.fingerprint}".encode("utf-8")).hexdigest()
+    
+    def make_chunk_id(self, filename: str, content_hash: str, chunk_index: int) -> str:
+        # Identical files can be stored under several names, so the name is part of the key
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{filename}:{content_hash}:{chunk_index}"))
+    
+    def delete_stale_rows(self, filename: str, keep_ids: List[str]):
+        with self.pg_conn:
+            cursor = self.pg_conn.cursor()
+            cursor.execute(
+                "DELETE FROM chunks WHERE paper_filename = %s AND NOT (id = ANY(%s))",
+                (filename, keep_ids)
+            )
+            cursor.close()
+    
+    def delete_stale_vectors(self, filename: str, keep_ids: List[str]):
+        results = self.vector_store.get(where={"filename": filename}, include=[])
+        keep = set(keep_ids)
+        stale_ids = [chunk_id for chunk_id in results['ids'] if chunk_id not in keep]
+        for start in range(0, len(stale_ids), self.chroma_batch_size):
+            # The filename keeps a sharded delete on that document's shard
+            self.vector_store.delete(ids=stale_ids[start:start + self.chroma_batch_size], where={"filename": filename})
+        self.vector_store_dirty = self.vector_store_dirty or bool(stale_ids)
+    
+    def discard_stored_chunks(self, filename: str, content_hash: str, chunk_ids: List[str]):
+        # Drops the batches of a document that failed before it was marked current
+        if not chunk_ids:
+            return
+        try:
+            with self.pg_conn:
+                cursor = self.pg_conn.cursor()
+                cursor.execute("SELECT content_hash FROM documents WHERE filename = %s", (filename,))
+                current = cursor.fetchone()
+                # Reprocessing an unchanged document rewrites the IDs it is served from
+                if current and current[0] == content_hash:
+                    cursor.close()
+                    return
+                cursor.execute("DELETE FROM chunks WHERE id = ANY(%s)", (chunk_ids,))
+                cursor.close()
+            for start in range(0, len(chunk_ids), self.chroma_batch_size):
+                self.vector_store.delete(ids=chunk_ids[start:start + self.chroma_batch_size],
+                                         where={"filename": filename})
+            self.vector_store_dirty = True
+        except Exception:
+            logger.exception("Failed to delete the partly stored chunks of %s", filename)
+    
+    def store_chunks_in_vector_store(self, chunk_ids: List[str], embeddings: List[List[float]],
+                                 metadatas: List[Dict], documents: List[str]):
+        for start in range(0, len(chunk_ids), self.chroma_batch_size):
+            end = start + self.chroma_batch_size
+            self.vector_store.upsert(
+                ids=chunk_ids[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end],
+                documents=documents[start:end]
+            )
+        self.vector_store_dirty = True
     
     def clear_existing_data(self, filename: str = None):
-        cursor = self.pg_conn.cursor()
+        with self.pg_conn:
+            cursor = self.pg_conn.cursor()
+            if filename:
+                cursor.execute("DELETE FROM chunks WHERE paper_filename = %s", (filename,))
+                cursor.execute("DELETE FROM documents WHERE filename = %s", (filename,))
+            else:
+                cursor.execute("DELETE FROM chunks")
+                cursor.execute("DELETE FROM documents")
+            cursor.close()
         
         if filename:
-            cursor.execute("DELETE FROM chunks WHERE paper_filename = %s", (filename,))
-            cursor.execute("DELETE FROM documents WHERE filename = %s", (filename,))
-            
             try:
-                results = self.chroma_collection.get(where={"filename": filename})
+                results = self.vector_store.get(where={"filename": filename}, include=[])
                 if results['ids']:
-                    self.chroma_collection.delete(ids=results['ids'])
+                    self.vector_store.delete(ids=results['ids'], where={"filename": filename})
+                    self.vector_store_dirty = True
             except Exception:
-                pass
+                logger.exception("Failed to delete vectors for %s", filename)
+        elif isinstance(self.vector_store, LocalVectorIndex):
+            self.vector_store.delete(where=None)
+            self.vector_store_dirty = True
         else:
-            cursor.execute("DELETE FROM chunks")
-            cursor.execute("DELETE FROM documents")
-            
             try:
-                try:
-                    self.chroma_client.delete_collection("document_chunks")
-                except Exception:
-                    pass  # Collection might not exist
-                
-                self.chroma_collection = self.chroma_client.create_collection(
-                    name="document_chunks",
-                    metadata={"description": "Document chunks for RAG system"}
-                )
+                self.vector_store.clear()
             except Exception:
-                pass
-        
-        cursor.close()
+                logger.exception("Failed to recreate the document_chunks collections")
     
-    def process_document_chunks(self, filename: str, chunks: List[Dict[str, str]], 
-                               file_path: str = None):
-        if not chunks:
-            return
+    def embed_document_chunks(self, filename: str, chunks: List[Dict[str, str]],
+                              content_hash: str = None) -> Dict:
+        texts = [chunk["text"] for chunk in chunks]
         
-        self.store_document_metadata(filename, file_path or filename, len(chunks))
+        embeddings = self.generate_embeddings(texts) if texts else []
         
-        texts = [chunk["text"] for chunk in chunks]
+        content_hash = content_hash or hashlib.sha256("".join(texts).encode("utf-8")).hexdigest()
+        chunk_ids = [self.make_chunk_id(filename, content_hash, chunk["chunk_index"]) for chunk in chunks]
+        rows = []
+        metadatas = []
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            section_title = chunk.get("section_title", "Content")
+            page_num = chunk.get("page_num", 0)
+            page_end = chunk.get("page_end", page_num)
+            rows.append((chunk_id, filename, section_title, chunk["text"], chunk["chunk_index"], page_num, page_end))
+            metadatas.append({
+                "filename": filename,
+                "section_title": section_title,
+                "section": chunk.get("section", section_title),
+                "chunk_index": chunk["chunk_index"],
+                "page_num": page_num,
+                "page_end": page_end
+            })
         
-        embeddings = self.generate_embeddings(texts)
+        return {
+            "filename": filename,
+            "content_hash": content_hash,
+            "chunk_ids": chunk_ids,
+            "rows": rows,
+            "metadatas": metadatas,
+            "texts": texts,
+            "embeddings": embeddings
+        }
+    
+    def store_embedded_chunks(self, embedded: Dict, file_path: str = None, stored_ids: List[str] = None,
+                              last: bool = True) -> List[str]:
+        filename = embedded["filename"]
+        chunk_ids = (stored_ids or []) + embedded["chunk_ids"]
         
-        for chunk, embedding in zip(chunks, embeddings):
-            chunk_id = str(uuid.uuid4())
-            
-            self.store_chunk_in_postgres(
-                chunk_id=chunk_id,
-                filename=filename,
-                section_title=chunk.get("section_title", "Content"),
-                chunk_text=chunk["text"],
-                chunk_index=chunk["chunk_index"]
+        try:
+            # Vectors go first so a document is only marked current once both stores have it
+            self.store_chunks_in_vector_store(
+                embedded["chunk_ids"], embedded["embeddings"], embedded["metadatas"], embedded["texts"]
             )
             
-            metadata = {
-                "filename": filename,
-                "section_title": chunk.get("section_title", "Content"),
-                "chunk_index": chunk["chunk_index"],
-                "page_num": chunk.get("page_num", 0)
-            }
+            # One transaction per batch; a streamed document is only marked current with its last batch, so one
+            # interrupted part way is reprocessed on the next run
+            with self.pg_conn:
+                if last:
+                    self.store_document_metadata(filename, file_path or filename, len(chunk_ids),
+                                                 embedded["content_hash"])
+                self.store_chunks_in_postgres(embedded["rows"])
+        except Exception:
+            self.discard_stored_chunks(filename, embedded["content_hash"], chunk_ids)
+            raise
+        if not last:
+            return chunk_ids
+        
+        # Old chunks go only after the new ones are committed, so a query never finds the document missing
+        self.delete_stale_vectors(filename, chunk_ids)
+        if isinstance(self.vector_store, LocalVectorIndex):
+            # The API still searches the last published snapshot, whose IDs point at the old rows
+            self.pending_cleanup[filename] = chunk_ids
+        else:
+            self.delete_stale_rows(filename, chunk_ids)
+        return chunk_ids
+    
+    def process_document_chunks(self, filename: str, chunks: List[Dict[str, str]], 
+                               file_path: str = None, content_hash: str = None):
+        if not chunks:
+            return
+        
+        self.store_embedded_chunks(self.embed_document_chunks(filename, chunks, content_hash), file_path)
+    
+    def _store_worker(self, store_queue: queue.Queue, stats: IngestStats):
+        stored_ids = {}
+        failed = set()
+        while True:
+            item = store_queue.get()
+            if item is None:
+                return
             
-            self.store_chunk_in_chromadb(chunk_id, embedding, metadata)
+            embedded, file_path, last = item
+            filename = embedded["filename"]
+            if filename in failed:
+                continue
+            if embedded.get("discard"):
+                self.discard_stored_chunks(filename, embedded["content_hash"], stored_ids.pop(filename, None))
+                continue
+            started = time.perf_counter()
+            try:
+                stored_ids[filename] = self.store_embedded_chunks(
+                    embedded, file_path, stored_ids.pop(filename, None), last
+                )
+            except Exception as e:
+                logger.exception("Failed to store %s", filename)
+                failed.add(filename)
+                stats.record_failure("store", filename, e)
+                continue
+            stats.record("store", len(embedded["rows"]), time.perf_counter() - started)
+            if last:
+                del stored_ids[filename]
+                stats.record_document()
+    
+    def plan_ingestion(self, pdf_directory: str, force: bool = False,
+                       filenames: List[str] = None) -> Tuple[Dict[str, str], List[str], int]:
+        stored_hashes = self.load_document_hashes()
+        present = list_pdf_files(pdf_directory)
+        if filenames is not None:
+            # A job for named files hashes only those
+            present = [filename for filename in present if filename in filenames]
+            stored_hashes = {filename: stored_hashes[filename] for filename in filenames if filename in stored_hashes}
+        current_hashes = {
+            filename: self.document_hash(compute_file_hash(os.path.join(pdf_directory, filename)))
+            for filename in present
+        }
+        
+        changed = {
+            filename: content_hash for filename, content_hash in current_hashes.items()
+            if force or stored_hashes.get(filename) != content_hash
+        }
+        removed = [filename for filename in stored_hashes if filename not in current_hashes]
+        unchanged = len(current_hashes) - len(changed)
+        return changed, removed, unchanged
+    
+    def process_all_documents(self, pdf_directory: str, clear_existing: bool = False,
+                              filenames: List[str] = None, stats: IngestStats = None,
+                              force: bool = False) -> IngestStats:
+        local = isinstance(self.vector_store, LocalVectorIndex)
+        # initialize.py and the ingestion worker can both write the local index, so runs take turns
+        with self.vector_store.writer_lock() if local else nullcontext():
+            if local and not self.vector_store_dirty and self.vector_store.reload_if_changed():
+                logger.info("Loaded snapshot %s published by another writer", self.vector_store.snapshot_version)
+                # Rows to keep are now the ones that snapshot points at
+                for filename in self.pending_cleanup:
+                    self.pending_cleanup[filename] = self.vector_store.get(
+                        where={"filename": filename}, include=[]
+                    )["ids"]
+            return self._process_documents(pdf_directory, clear_existing, filenames, stats, force)
     
-    def process_all_documents(self, pdf_directory: str, clear_existing: bool = True):
+    def _process_documents(self, pdf_directory: str, clear_existing: bool, filenames: List[str],
+                           stats: IngestStats, force: bool) -> IngestStats:
         if clear_existing:
             self.clear_existing_data()
         
-        all_documents = process_all_pdfs(pdf_directory)
+        stats = stats or IngestStats()
+        cache_counts = (self.embedding_cache.hits, self.embedding_cache.misses) if self.embedding_cache else (0, 0)
+        changed, removed, unchanged = self.plan_ingestion(pdf_directory, force, filenames)
+        stats.planned = len(changed)
+        stats.record_document("skipped", unchanged)
         
-        if not all_documents:
-            return
+        for filename in removed:
+            self.clear_existing_data(filename)
+            stats.record_document("removed")
+        
+        if not changed:
+            self.persist_vector_store()
+            if not self.defer_cleanup:
+                self.cleanup_stale_rows()
+            stats.finish()
+            return stats
+        
+        store_queue = queue.Queue(maxsize=self.queue_size)
+        writer = threading.Thread(target=self._store_worker, args=(store_queue, stats), daemon=True)
+        writer.start()
+        
+        # A long PDF arrives in batches of sections, each embedded and stored before the rest is parsed
+        streamed = set()
+        failed = set()
+        
+        def discard_streamed(filename: str):
+            # Batches already stored would otherwise sit next to the previous version
+            if filename in streamed:
+                discard = {"filename": filename, "content_hash": changed[filename], "discard": True}
+                store_queue.put((discard, None, False))
         
-        for filename, chunks in all_documents.items():
+        def record_parse_failure(filename: str, error: Exception):
+            failed.add(filename)
+            stats.record_failure("parse", filename, error)
+            discard_streamed(filename)
+        
+        try:
+            for filename, chunks, parsed in iter_processed_batches(
+                pdf_directory, list(changed), on_error=record_parse_failure
+            ):
+                if parsed is not None:
+                    stats.pages += parsed[0]
+                    stats.record("parse", *parsed)
+                if filename in failed or not (chunks or filename in streamed):
+                    continue
+                if parsed is None:
+                    streamed.add(filename)
+                
+                started = time.perf_counter()
+                try:
+                    embedded = self.embed_document_chunks(filename, chunks, changed[filename])
+                except Exception as e:
+                    logger.exception("Failed to embed %s", filename)
+                    failed.add(filename)
+                    stats.record_failure("embed", filename, e)
+                    discard_streamed(filename)
+                    continue
+                stats.record("embed", len(chunks), time.perf_counter() - started)
+                
+                store_queue.put((embedded, os.path.join(pdf_directory, filename), parsed is not None))
+        finally:
+            store_queue.put(None)
+            writer.join()
+            if self.embedding_cache:
+                stats.record_embedding_cache(self.embedding_cache.hits - cache_counts[0],
+                                             self.embedding_cache.misses - cache_counts[1])
+            self.persist_vector_store()
+            if not self.defer_cleanup:
+                self.cleanup_stale_rows()
+            stats.finish()
+        
+        return stats
+    
+    def persist_vector_store(self):
+        # The local index is only visible to the API once a snapshot is published
+        if isinstance(self.vector_store, LocalVectorIndex) and self.vector_store_dirty:
+            self.vector_store.snapshot()
+            self.vector_store_dirty = False
+    
+    def cleanup_stale_rows(self):
+        # Only safe once every reader has moved to a snapshot published after these documents were stored
+        # Keyed by filename, so a document stored twice before cleanup keeps only its latest chunks
+        while self.pending_cleanup:
+            filename, keep_ids = self.pending_cleanup.popitem()
             try:
-                file_path = os.path.join(pdf_directory, filename)
-                self.process_document_chunks(filename, chunks, file_path)
+                self.delete_stale_rows(filename, keep_ids)
             except Exception:
-                continue
+                logger.exception("Failed to delete stale chunks for %s", filename)
     
     def close_connections(self):
         if self.pg_conn:
             self.pg_conn.close()
+        if self.embedding_cache:
+            self.embedding_cache.close()
 def main():
+    logging.basicConfig(level=logging.INFO)
     processor = DataProcessor()
     
     try:
@@ -172,9 +550,9 @@ def main():
         pdf_directory = "/app/data/pdfs"
         if os.path.exists(pdf_directory):
             processor.process_all_documents(pdf_directory)
-        
+    
     except Exception:
-        pass
+        logger.exception("Ingestion failed")
     finally:
         processor.close_connections()
 if __name__ == "__main__":
@@ -1,8 +1,8 @@
 
 import psycopg2
-import chromadb
 import os
 from dotenv import load_dotenv
+from .sharding import ChromaShards
 
 load_dotenv()
 
@@ -37,40 +37,67 @@ def setup_postgres():
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        cursor.close()
-        conn.close()
         
-    except Exception as e:
-        raise
-def setup_chromadb():
-    try:
-        client = chromadb.HttpClient(
-            host=os.getenv("CHROMA_HOST", "localhost"),
-            port=int(os.getenv("CHROMA_PORT", "8000"))
-        )
+        cursor.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)")
+        
+        cursor.execute("""
+            ALTER TABLE chunks ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                to_tsvector('english', COALESCE(section_title, '') || ' ' || chunk_text)
+            ) STORED
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS chunks_search_vector_idx ON chunks USING GIN (search_vector)")
+        
+        cursor.execute("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS page_num INTEGER")
+        cursor.execute("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS page_end INTEGER")
+        # Filtered retrieval and per-document deletes both narrow by paper first
+        cursor.execute("CREATE INDEX IF NOT EXISTS chunks_paper_filename_idx ON chunks (paper_filename, page_num, page_end)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS chunks_section_title_idx ON chunks (section_title text_pattern_ops)")
         
-        try:
-            collection = client.create_collection(
-                name="document_chunks",
-                metadata={"description": "Document chunks for RAG system"}
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id SERIAL PRIMARY KEY,
+                kind VARCHAR(20) NOT NULL,
+                filename VARCHAR(500),
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                documents_total INTEGER NOT NULL DEFAULT 0,
+                documents_done INTEGER NOT NULL DEFAULT 0,
+                documents_skipped INTEGER NOT NULL DEFAULT 0,
+                documents_failed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                summary TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                finished_at TIMESTAMP
             )
-        except Exception as e:
-            if "already exists" in str(e).lower() or "UniqueConstraintError" in str(e):
-                try:
-                    collection = client.get_collection("document_chunks")
-                except Exception as get_error:
-                    pass  # Collection doesn't exist, will be created later
-            else:
-                raise e
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_status_idx ON ingest_jobs (status, id)")
         
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model VARCHAR(200) NOT NULL,
+                text_hash CHAR(64) NOT NULL,
+                embedding BYTEA NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        cursor.close()
+        conn.close()
+    
     except Exception as e:
         raise
+def setup_chromadb():
+    shards = ChromaShards()
+    for shard in range(shards.shards):
+        shards.collection(shard)
 def main():
     
     try:
         setup_postgres()
         setup_chromadb()
-        
+    
     except Exception as e:
         raise
 if __name__ == "__main__":
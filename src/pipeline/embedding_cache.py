@@ -0,0 +1,92 @@
+import hashlib
+import os
+import re
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from typing import Dict, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_WHITESPACE = re.compile(r"\s+")
+
+def text_hash(text: str) -> str:
+    # Re-extraction can shift whitespace without changing what the model sees
+    return hashlib.sha256(_WHITESPACE.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    
+    def __init__(self, model_key: str, batch_size: int = None):
+        self.model_key = model_key
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_CACHE_BATCH_SIZE", "1000"))
+        self.conn = None
+        self.hits = 0
+        self.misses = 0
+    
+    def connect(self) -> "EmbeddingCache":
+        # Its own autocommit connection, so cache writes never join or wait on a document transaction
+        self.conn = psycopg2.connect(
+            host=os.getenv("DB_HOST", "localhost"),
+            database=os.getenv("DB_NAME", "ragdb"),
+            user=os.getenv("DB_USER", "raguser"),
+            password=os.getenv("DB_PASSWORD", "ragpass")
+        )
+        self.conn.autocommit = True
+        return self
+    
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+    
+    def prune(self) -> int:
+        # Vectors from any other model are useless now and would never be hit again
+        with self.conn.cursor() as cur:
+            cur.execute("DELETE FROM embedding_cache WHERE model <> %s", (self.model_key,))
+            return cur.rowcount
+    
+    def lookup(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self.conn.cursor() as cur:
+            for start in range(0, len(unique), self.batch_size):
+                cur.execute(
+                    "SELECT text_hash, embedding FROM embedding_cache WHERE model = %s AND text_hash = ANY(%s)",
+                    (self.model_key, unique[start:start + self.batch_size])
+                )
+                for hash_value, embedding in cur.fetchall():
+                    found[hash_value] = np.frombuffer(embedding, dtype=np.float32)
+        return found
+    
+    def store(self, embeddings: Dict[str, np.ndarray]):
+        rows = [
+            (self.model_key, hash_value, psycopg2.Binary(np.asarray(vector, dtype=np.float32).tobytes()))
+            for hash_value, vector in embeddings.items()
+        ]
+        with self.conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO embedding_cache (model, text_hash, embedding) VALUES %s
+                ON CONFLICT (model, text_hash) DO NOTHING
+            """, rows, page_size=self.batch_size)
+    
+    def encode(self, texts: List[str], encode_batch) -> np.ndarray:
+        hashes = [text_hash(text) for text in texts]
+        cached = self.lookup(hashes)
+        
+        # Identical texts within a batch are encoded once
+        missing = {}
+        for text, hash_value in zip(texts, hashes):
+            if hash_value not in cached and hash_value not in missing:
+                missing[hash_value] = text
+        
+        if missing:
+            encoded = encode_batch(list(missing.values()))
+            computed = dict(zip(missing, np.asarray(encoded, dtype=np.float32)))
+            self.store(computed)
+            cached.update(computed)
+        
+        hits = sum(1 for hash_value in hashes if hash_value not in missing)
+        self.hits += hits
+        self.misses += len(texts) - hits
+        return np.stack([cached[hash_value] for hash_value in hashes]) if texts else np.zeros((0, 0), dtype=np.float32)
@@ -0,0 +1,140 @@
+import json
+import os
+import time
+import numpy as np
+from typing import List, Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class EmbeddingBackend:
+    
+    def __init__(self, model_name: str = None, mode: str = None, batch_size: int = None,
+                 num_threads: int = None, sort_by_length: bool = None, normalize: bool = None):
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        self.mode = mode or os.getenv("EMBEDDING_BACKEND", "fp32")
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_ENCODE_BATCH_SIZE", "64"))
+        self.num_threads = num_threads or int(os.getenv("EMBEDDING_THREADS", "0"))
+        self.sort_by_length = sort_by_length if sort_by_length is not None else \
+            os.getenv("EMBEDDING_SORT_BY_LENGTH", "true").lower() == "true"
+        self.normalize = normalize if normalize is not None else \
+            os.getenv("EMBEDDING_NORMALIZE", "false").lower() == "true"
+        self.model = None
+        
+        if self.mode not in ("fp32", "int8"):
+            raise ValueError(f"Unknown embedding backend: {self.mode}")
+    
+    def load(self) -> "EmbeddingBackend":
+        import torch
+        from sentence_transformers import SentenceTransformer
+        
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        
+        model = SentenceTransformer(self.model_name, device="cpu")
+        model.eval()
+        if self.mode == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        
+        self.model = model
+        return self
+    
+    @property
+    def cache_key(self) -> str:
+        # Quantization and normalization change the vectors, so they are part of the model identity
+        return f"{self.model_name}:{self.mode}{':normalized' if self.normalize else ''}"
+    
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        
+        order = list(range(len(texts)))
+        if self.sort_by_length:
+            # Similar lengths in one batch keep padding, and wasted FLOPs, small
+            order.sort(key=lambda i: len(texts[i]), reverse=True)
+        
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            embeddings[batch] = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize,
+                show_progress_bar=False
+            )
+        
+        return embeddings
+
+def _top_k(query_embeddings: np.ndarray, corpus_embeddings: np.ndarray, k: int) -> np.ndarray:
+    queries = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    corpus = corpus_embeddings / np.linalg.norm(corpus_embeddings, axis=1, keepdims=True)
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def compare_backends(baseline: EmbeddingBackend, candidate: EmbeddingBackend,
+                     corpus_texts: List[str], query_texts: List[str], k: int = 10) -> Dict:
+    report = {"k": k, "corpus_size": len(corpus_texts), "queries": len(query_texts)}
+    
+    encoded = {}
+    for name, backend in (("baseline", baseline), ("candidate", candidate)):
+        started = time.perf_counter()
+        corpus_embeddings = backend.encode(corpus_texts)
+        elapsed = time.perf_counter() - started
+        encoded[name] = (corpus_embeddings, backend.encode(query_texts))
+        report[name] = {
+            "mode": backend.mode,
+            "batch_size": backend.batch_size,
+            "texts_per_second": len(corpus_texts) / elapsed if elapsed else 0.0
+        }
+    
+    baseline_corpus, baseline_queries = encoded["baseline"]
+    candidate_corpus, candidate_queries = encoded["candidate"]
+    
+    baseline_hits = _top_k(baseline_queries, baseline_corpus, k)
+    candidate_hits = _top_k(candidate_queries, candidate_corpus, k)
+    overlaps = [len(set(a) & set(b)) / len(a) for a, b in zip(baseline_hits, candidate_hits)]
+    
+    cosines = np.sum(baseline_corpus * candidate_corpus, axis=1) / (
+        np.linalg.norm(baseline_corpus, axis=1) * np.linalg.norm(candidate_corpus, axis=1)
+    )
+    
+    report["recall_at_k_vs_baseline"] = float(np.mean(overlaps))
+    report["mean_cosine_to_baseline"] = float(np.mean(cosines))
+    report["speedup"] = report["candidate"]["texts_per_second"] / report["baseline"]["texts_per_second"] \
+        if report["baseline"]["texts_per_second"] else 0.0
+    return report
+
+def main():
+    import argparse
+    from .data_ingest import PDFProcessor, list_pdf_files
+    
+    parser = argparse.ArgumentParser(description="Compare an embedding backend against the fp32 baseline")
+    parser.add_argument("--pdf-dir", default="/app/data/pdfs")
+    parser.add_argument("--mode", default="int8")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    
+    processor = PDFProcessor()
+    corpus_texts = []
+    for filename in list_pdf_files(args.pdf_dir):
+        _, chunks = processor.process_pdf(os.path.join(args.pdf_dir, filename))
+        corpus_texts.extend(chunk["text"] for chunk in chunks)
+    
+    # Leading words of evenly spaced chunks stand in for user questions
+    step = max(len(corpus_texts) // args.queries, 1)
+    query_texts = [" ".join(text.split()[:16]) for text in corpus_texts[::step][:args.queries]]
+    
+    baseline = EmbeddingBackend(mode="fp32", batch_size=args.batch_size, num_threads=args.threads).load()
+    candidate = EmbeddingBackend(mode=args.mode, batch_size=args.batch_size, num_threads=args.threads).load()
+    print(json.dumps(compare_backends(baseline, candidate, corpus_texts, query_texts, args.k), indent=2))
+
+if __name__ == "__main__":
+    main()
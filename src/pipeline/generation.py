@@ -0,0 +1,272 @@
+import asyncio
+import collections
+import logging
+import math
+import os
+import random
+from typing import AsyncIterator, List
+from dotenv import load_dotenv
+from . import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class GenerationOverloaded(Exception):
+    pass
+
+class GenerationTimeout(Exception):
+    pass
+
+class GenerationUnavailable(Exception):
+    pass
+
+class StubLLMError(Exception):
+    code = 503
+
+def is_retryable(error: BaseException) -> bool:
+    # google.api_core errors carry the HTTP status in `code`; anything else is a bug, not a blip
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+class _StubResponse:
+    
+    def __init__(self, text: str):
+        self.text = text
+
+class _StubStream:
+    
+    def __init__(self, parts: List[str], delay: float):
+        self.parts = parts
+        self.delay = delay
+    
+    async def __aiter__(self):
+        for part in self.parts:
+            await asyncio.sleep(self.delay)
+            yield _StubResponse(part)
+
+class StubLLM:
+    
+    def __init__(self, latency_ms: float = None, jitter_ms: float = None, tokens: int = None, seed: int = None,
+                 distribution: str = None, slow_rate: float = None, slow_ms: float = None, error_rate: float = None):
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv("STUB_LLM_LATENCY_MS", "500"))
+        self.jitter_ms = jitter_ms if jitter_ms is not None else float(os.getenv("STUB_LLM_JITTER_MS", "0"))
+        self.tokens = tokens or int(os.getenv("STUB_LLM_TOKENS", "64"))
+        self.distribution = distribution or os.getenv("STUB_LLM_DISTRIBUTION", "uniform")
+        self.slow_rate = slow_rate if slow_rate is not None else float(os.getenv("STUB_LLM_SLOW_RATE", "0"))
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv("STUB_LLM_SLOW_MS", "5000"))
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("STUB_LLM_ERROR_RATE", "0"))
+        self.random = random.Random(seed if seed is not None else int(os.getenv("STUB_LLM_SEED", "0")))
+    
+    def _latency(self) -> float:
+        if self.random.random() < self.slow_rate:
+            return self.slow_ms / 1000
+        if self.distribution == "lognormal":
+            # Median latency_ms with a long right tail; jitter_ms sets the spread
+            sigma = math.log1p(self.jitter_ms / self.latency_ms) if self.latency_ms else 0.0
+            return self.random.lognormvariate(math.log(max(self.latency_ms, 1e-3)), sigma) / 1000
+        if self.distribution == "exponential":
+            return self.random.expovariate(1 / self.latency_ms) / 1000 if self.latency_ms else 0.0
+        return max(self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms), 0.0) / 1000
+    
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        latency = self._latency()
+        if self.random.random() < self.error_rate:
+            await asyncio.sleep(latency / 2)
+            raise StubLLMError("Stub LLM unavailable")
+        if stream:
+            return _StubStream(["token " for _ in range(self.tokens)], latency / max(self.tokens, 1))
+        await asyncio.sleep(latency)
+        return _StubResponse(" ".join(["token"] * self.tokens))
+
+class GenerationClient:
+    
+    def __init__(self, model, max_concurrency: int = None, max_queue: int = None, deadline_s: float = None,
+                 attempt_timeout_s: float = None, max_retries: int = None, retry_base_ms: float = None,
+                 retry_max_ms: float = None, hedge: bool = None, hedge_delay_ms: float = None,
+                 hedge_quantile: float = None):
+        self.model = model
+        self.max_concurrency = max_concurrency or int(os.getenv("GENERATION_MAX_CONCURRENCY", "16"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("GENERATION_MAX_QUEUE", "64"))
+        self.deadline = deadline_s or float(os.getenv("GENERATION_DEADLINE_S", "30"))
+        self.attempt_timeout = attempt_timeout_s or float(os.getenv("GENERATION_ATTEMPT_TIMEOUT_S", "15"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GENERATION_MAX_RETRIES", "2"))
+        self.retry_base = (retry_base_ms or float(os.getenv("GENERATION_RETRY_BASE_MS", "200"))) / 1000
+        self.retry_max = (retry_max_ms or float(os.getenv("GENERATION_RETRY_MAX_MS", "2000"))) / 1000
+        self.hedge = hedge if hedge is not None else os.getenv("GENERATION_HEDGE", "false").lower() == "true"
+        self.hedge_delay = (hedge_delay_ms or float(os.getenv("GENERATION_HEDGE_DELAY_MS", "1000"))) / 1000
+        self.hedge_quantile = hedge_quantile or float(os.getenv("GENERATION_HEDGE_QUANTILE", "0.95"))
+        self.latencies = collections.deque(maxlen=int(os.getenv("GENERATION_LATENCY_WINDOW", "500")))
+        self.inflight = 0
+        self.queued = 0
+        self.random = random.Random()
+        self._slots = None
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created on first use so it belongs to the serving event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+    
+    def _remaining(self, deadline: float) -> float:
+        return deadline - asyncio.get_running_loop().time()
+    
+    def check_capacity(self):
+        if self.queued >= self.max_queue and self._semaphore().locked():
+            metrics.GENERATION_REQUESTS.inc(outcome="shed")
+            raise GenerationOverloaded("Generation queue is full")
+    
+    async def _acquire(self, deadline: float):
+        if not self._semaphore().locked():
+            # A free slot is taken without suspending, so it is counted before the next request checks
+            await self._semaphore().acquire()
+            self.inflight += 1
+            return
+        
+        self.check_capacity()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore().acquire(), max(self._remaining(deadline), 0))
+        except asyncio.TimeoutError:
+            metrics.GENERATION_REQUESTS.inc(outcome="timeout")
+            raise GenerationTimeout("Deadline passed while queued for generation") from None
+        finally:
+            self.queued -= 1
+        self.inflight += 1
+    
+    def _release(self):
+        self.inflight -= 1
+        self._semaphore().release()
+    
+    def hedge_after(self) -> float:
+        # Until enough calls have been seen, fall back to the configured delay
+        if len(self.latencies) < 20:
+            return self.hedge_delay
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * self.hedge_quantile), len(ordered) - 1)]
+    
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries from many requests from arriving in lockstep
+        return self.random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+    
+    async def _call(self, prompt: str, deadline: float) -> str:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        timeout = min(self.attempt_timeout, self._remaining(deadline))
+        response = await asyncio.wait_for(self.model.generate_content_async(prompt), max(timeout, 0))
+        self.latencies.append(loop.time() - started)
+        return response.text
+    
+    async def _hedged_call(self, prompt: str, deadline: float) -> str:
+        primary = asyncio.ensure_future(self._call(prompt, deadline))
+        hedge = None
+        try:
+            if not self.hedge:
+                return await primary
+            
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_after())
+            # A hedge only uses spare capacity, so it cannot push other requests into the queue
+            if done or self._semaphore().locked() or self._remaining(deadline) <= 0:
+                return await primary
+            
+            await self._semaphore().acquire()
+            self.inflight += 1
+            metrics.GENERATION_HEDGES.inc(result="sent")
+            hedge = asyncio.ensure_future(self._call(prompt, deadline))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.GENERATION_HEDGES.inc(result="won")
+                        return task.result()
+            return primary.result()
+        finally:
+            # Whichever call lost, or both if the caller went away, stops holding an upstream slot
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+                self._release()
+    
+    async def generate(self, prompt: str) -> str:
+        deadline = asyncio.get_running_loop().time() + self.deadline
+        await self._acquire(deadline)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    answer = await self._hedged_call(prompt, deadline)
+                except Exception as e:
+                    delay = self._backoff(attempt)
+                    if not is_retryable(e) or attempt == self.max_retries or self._remaining(deadline) <= delay:
+                        self._raise_final(e)
+                    logger.warning("Generation attempt %d failed, retrying in %.2fs: %r", attempt + 1, delay, e)
+                    metrics.GENERATION_RETRIES.inc()
+                    await asyncio.sleep(delay)
+                    continue
+                metrics.GENERATION_REQUESTS.inc(outcome="ok")
+                return answer
+        finally:
+            self._release()
+    
+    def _raise_final(self, error: Exception):
+        if isinstance(error, asyncio.TimeoutError):
+            metrics.GENERATION_REQUESTS.inc(outcome="timeout")
+            raise GenerationTimeout("Generation deadline exceeded") from error
+        metrics.GENERATION_REQUESTS.inc(outcome="error")
+        if is_retryable(error):
+            # The upstream kept failing; anything else is a bug and stays a 500
+            raise GenerationUnavailable(f"LLM unavailable: {str(error) or type(error).__name__}") from error
+        raise error
+    
+    async def _open_stream(self, prompt: str, deadline: float):
+        timeout = max(min(self.attempt_timeout, self._remaining(deadline)), 0)
+        response = await asyncio.wait_for(self.model.generate_content_async(prompt, stream=True), timeout)
+        parts = response.__aiter__()
+        try:
+            first = await asyncio.wait_for(parts.__anext__(), max(min(self.attempt_timeout, self._remaining(deadline)), 0))
+        except StopAsyncIteration:
+            first = None
+        return parts, first
+    
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # Retries stop at the first token, since a retry would repeat text already sent; streams are not hedged
+        deadline = asyncio.get_running_loop().time() + self.deadline
+        await self._acquire(deadline)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    parts, first = await self._open_stream(prompt, deadline)
+                    break
+                except Exception as e:
+                    delay = self._backoff(attempt)
+                    if not is_retryable(e) or attempt == self.max_retries or self._remaining(deadline) <= delay:
+                        self._raise_final(e)
+                    logger.warning("Generation stream attempt %d failed, retrying in %.2fs: %r", attempt + 1, delay, e)
+                    metrics.GENERATION_RETRIES.inc()
+                    await asyncio.sleep(delay)
+            
+            chunk = first
+            while chunk is not None:
+                yield chunk.text
+                try:
+                    chunk = await asyncio.wait_for(parts.__anext__(), max(self._remaining(deadline), 0))
+                except StopAsyncIteration:
+                    chunk = None
+                except asyncio.TimeoutError as e:
+                    self._raise_final(e)
+            metrics.GENERATION_REQUESTS.inc(outcome="ok")
+        finally:
+            self._release()
+    
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "hedge_after_seconds": self.hedge_after() if self.hedge else None
+        }
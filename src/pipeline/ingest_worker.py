@@ -0,0 +1,176 @@
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+from .chunk_store import ChunkStore
+from .data_ingest import list_pdf_files
+from .data_processing import DataProcessor, IngestStats
+from .jobs import JobQueue, pdf_directory
+from .vector_index import LocalVectorIndex
+from . import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class IngestWorker:
+    
+    def __init__(self, directory: str = None, poll_interval: float = None, watch: bool = None,
+                 watch_interval: float = None, nice: int = None, cleanup_grace: float = None,
+                 metrics_port: int = None):
+        self.directory = directory or pdf_directory()
+        self.poll_interval = poll_interval or float(os.getenv("INGEST_POLL_INTERVAL", "2"))
+        self.watch = watch if watch is not None else os.getenv("INGEST_WATCH", "false").lower() == "true"
+        self.watch_interval = watch_interval or float(os.getenv("INGEST_WATCH_INTERVAL", "10"))
+        self.nice = nice if nice is not None else int(os.getenv("INGEST_NICE", "10"))
+        # API workers pick up a new local index snapshot on their next version check
+        default_grace = 2 * float(os.getenv("CACHE_VERSION_CHECK_INTERVAL", "30"))
+        self.cleanup_grace = cleanup_grace if cleanup_grace is not None else \
+            float(os.getenv("INGEST_CLEANUP_GRACE_S", str(default_grace)))
+        self.progress_interval = float(os.getenv("INGEST_PROGRESS_INTERVAL", "2"))
+        self.lease_seconds = float(os.getenv("INGEST_JOB_LEASE_S", "120"))
+        self.max_backoff = float(os.getenv("INGEST_ERROR_BACKOFF_MAX_S", "60"))
+        self.metrics_port = metrics_port if metrics_port is not None else int(os.getenv("INGEST_METRICS_PORT", "9101"))
+        self.store = ChunkStore(max_connections=2)
+        self.jobs = JobQueue(self.store)
+        self.processor = DataProcessor()
+        self.cleanup_due = None
+        self.stop_event = threading.Event()
+        self._signature = None
+        self._pending_signature = None
+        self._next_watch = 0.0
+    
+    def throttle(self):
+        # The parsing pool inherits the niceness, so the API's query workers win any contention for CPU
+        if self.nice:
+            os.nice(self.nice)
+    
+    def _directory_signature(self) -> Tuple:
+        signature = []
+        for filename in list_pdf_files(self.directory):
+            try:
+                info = os.stat(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                continue
+            signature.append((filename, info.st_size, info.st_mtime_ns))
+        return tuple(signature)
+    
+    def check_directory(self):
+        now = time.monotonic()
+        if not self.watch or now < self._next_watch:
+            return
+        self._next_watch = now + self.watch_interval
+        
+        signature = self._directory_signature()
+        if self._signature is None:
+            self._signature = signature
+        elif signature != self._signature:
+            # Wait until two polls agree, so a file still being copied is not ingested half-written
+            if signature == self._pending_signature:
+                job = self.jobs.enqueue("rescan")
+                logger.info("PDF directory changed, queued rescan job %s", job["id"])
+                self._signature = signature
+                self._pending_signature = None
+            else:
+                self._pending_signature = signature
+    
+    def cleanup_if_due(self):
+        if self.cleanup_due is not None and time.monotonic() >= self.cleanup_due:
+            self.processor.cleanup_stale_rows()
+            self.cleanup_due = None
+    
+    def _report_progress(self, job_id: int, stats: IngestStats, done: threading.Event):
+        while not done.wait(self.progress_interval):
+            try:
+                self.jobs.update_progress(job_id, stats)
+            except Exception:
+                logger.warning("Failed to update progress of job %s", job_id, exc_info=True)
+    
+    def run_job(self, job: Dict):
+        logger.info("Starting %s job %s %s", job["kind"], job["id"], job["filename"] or self.directory)
+        stats = IngestStats()
+        done = threading.Event()
+        reporter = threading.Thread(target=self._report_progress, args=(job["id"], stats, done), daemon=True)
+        reporter.start()
+        
+        error = None
+        try:
+            self.processor.ensure_connections()
+            filenames = [job["filename"]] if job["kind"] == "file" else None
+            self.processor.process_all_documents(
+                self.directory, filenames=filenames, stats=stats, force=job["kind"] == "reprocess"
+            )
+        except Exception as e:
+            logger.exception("Job %s failed", job["id"])
+            error = str(e) or type(e).__name__
+            stats.finish()
+        finally:
+            done.set()
+            reporter.join()
+        
+        try:
+            self.jobs.finish(job["id"], stats, error)
+        except Exception:
+            # The job stays running without heartbeats, so requeue_abandoned hands it out again after the lease
+            logger.exception("Failed to record the end of job %s", job["id"])
+        logger.info("Finished job %s: %s", job["id"], stats.summary())
+        if self.processor.pending_cleanup:
+            self.cleanup_due = time.monotonic() + self.cleanup_grace
+    
+    def run_once(self) -> bool:
+        for job in self.jobs.requeue_abandoned(self.lease_seconds):
+            logger.warning("Requeued abandoned job %s", job["id"])
+        self.check_directory()
+        self.cleanup_if_due()
+        
+        job = self.jobs.claim()
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+    
+    def run(self):
+        self.throttle()
+        if self.metrics_port:
+            # Ingestion metrics are recorded in this process, so this process serves them
+            metrics.serve(self.metrics_port)
+        self.store.connect()
+        self.processor.initialize_connections()
+        self.processor.defer_cleanup = isinstance(self.processor.vector_store, LocalVectorIndex)
+        logger.info("Ingestion worker started on %s, directory watch %s", self.directory, "on" if self.watch else "off")
+        
+        failures = 0
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    ran = self.run_once()
+                    failures = 0
+                except Exception:
+                    # Typically Postgres restarting; the next pass reconnects
+                    failures += 1
+                    delay = min(self.poll_interval * 2 ** failures, self.max_backoff)
+                    logger.exception("Ingestion worker pass failed, retrying in %.1fs", delay)
+                    self.stop_event.wait(delay)
+                    continue
+                if not ran:
+                    self.stop_event.wait(self.poll_interval)
+        finally:
+            self.processor.cleanup_stale_rows()
+            self.processor.close_connections()
+            self.store.close()
+    
+    def stop(self, *args):
+        self.stop_event.set()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker = IngestWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+if __name__ == "__main__":
+    main()
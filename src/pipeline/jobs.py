@@ -0,0 +1,105 @@
+import os
+import psycopg2
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from .chunk_store import ChunkStore
+
+load_dotenv()
+
+JOB_COLUMNS = ("id", "kind", "filename", "status", "documents_total", "documents_done", "documents_skipped",
+               "documents_failed", "error", "summary", "created_at", "started_at", "finished_at")
+
+def pdf_directory() -> str:
+    directory = os.getenv("INGEST_PDF_DIR", "/app/data/pdfs")
+    if not os.path.exists(directory) and os.path.exists("./data/pdfs"):
+        directory = "./data/pdfs"
+    return directory
+
+class JobQueue:
+    
+    def __init__(self, store: ChunkStore):
+        self.store = store
+    
+    def _execute(self, query: str, params: tuple = None) -> List[Dict]:
+        # The worker outlives Postgres restarts; a broken pooled connection is dropped and the statement retried
+        for attempt in range(self.store.max_retries + 1):
+            try:
+                with self.store.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(query, params)
+                        rows = cur.fetchall() if cur.description else []
+                    conn.commit()
+                break
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt == self.store.max_retries:
+                    raise
+        return [self._with_progress(dict(zip(JOB_COLUMNS, row))) for row in rows]
+    
+    def _with_progress(self, job: Dict) -> Dict:
+        total = job["documents_total"]
+        if job["status"] in ("succeeded", "failed"):
+            job["progress"] = 1.0
+        else:
+            job["progress"] = (job["documents_done"] + job["documents_failed"]) / total if total else 0.0
+        return job
+    
+    def enqueue(self, kind: str, filename: str = None) -> Dict:
+        # A job that has not started yet already covers a second identical request
+        queued = self._execute(f"""
+            SELECT {", ".join(JOB_COLUMNS)} FROM ingest_jobs
+            WHERE status = 'queued' AND kind = %s AND filename IS NOT DISTINCT FROM %s
+            ORDER BY id LIMIT 1
+        """, (kind, filename))
+        if queued:
+            return queued[0]
+        
+        return self._execute(f"""
+            INSERT INTO ingest_jobs (kind, filename) VALUES (%s, %s)
+            RETURNING {", ".join(JOB_COLUMNS)}
+        """, (kind, filename))[0]
+    
+    def get(self, job_id: int) -> Optional[Dict]:
+        jobs = self._execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM ingest_jobs WHERE id = %s", (job_id,))
+        return jobs[0] if jobs else None
+    
+    def recent(self, limit: int = 20) -> List[Dict]:
+        return self._execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM ingest_jobs ORDER BY id DESC LIMIT %s", (limit,)
+        )
+    
+    def claim(self) -> Optional[Dict]:
+        jobs = self._execute(f"""
+            UPDATE ingest_jobs
+            SET status = 'running', started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM ingest_jobs WHERE status = 'queued'
+                ORDER BY id FOR UPDATE SKIP LOCKED LIMIT 1
+            )
+            RETURNING {", ".join(JOB_COLUMNS)}
+        """)
+        return jobs[0] if jobs else None
+    
+    def requeue_abandoned(self, lease_seconds: float) -> List[Dict]:
+        # A worker that died mid-job stops heartbeating; ingestion is idempotent, so the job can start over
+        return self._execute(f"""
+            UPDATE ingest_jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL
+            WHERE status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            RETURNING {", ".join(JOB_COLUMNS)}
+        """, (lease_seconds,))
+    
+    def update_progress(self, job_id: int, stats):
+        self._execute("""
+            UPDATE ingest_jobs
+            SET documents_total = %s, documents_done = %s, documents_skipped = %s, documents_failed = %s,
+                heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (stats.planned, stats.documents, stats.skipped, stats.failures, job_id))
+    
+    def finish(self, job_id: int, stats, error: str = None):
+        self._execute("""
+            UPDATE ingest_jobs
+            SET status = %s, documents_total = %s, documents_done = %s, documents_skipped = %s,
+                documents_failed = %s, error = %s, summary = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, ("failed" if error else "succeeded", stats.planned, stats.documents, stats.skipped,
+              stats.failures, error, stats.summary(), job_id))
@@ -0,0 +1,270 @@
+import bisect
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def set_total(self, value: float, **labels):
+        # For counts that only grow but are kept elsewhere, copied in at scrape time
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values
+        ]
+
+class Gauge(_Metric):
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+    
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values
+        ]
+
+class Histogram(_Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        
+        lines = self.header()
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def process_memory() -> Dict[str, int]:
+    # PSS and USS show what a forked worker really costs; RSS double counts pages shared with the master
+    kib = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    kib[name] = int(value.split()[0])
+    except OSError:
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    
+    return {
+        "rss": kib.get("Rss", 0) * 1024,
+        "pss": kib.get("Pss", 0) * 1024,
+        "uss": (kib.get("Private_Clean", 0) + kib.get("Private_Dirty", 0)) * 1024,
+        "shared": (kib.get("Shared_Clean", 0) + kib.get("Shared_Dirty", 0)) * 1024
+    }
+
+def process_age() -> float:
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return time.perf_counter()
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+def serve(port: int, registry: "Registry" = None):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    registry = registry or REGISTRY
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            for kind, value in process_memory().items():
+                PROCESS_MEMORY.set(value, kind=kind)
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    # For processes without the API, such as the ingestion worker; the daemon thread ends with the process
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+def write_textfile(path: str, registry: "Registry" = None):
+    # For one-shot runs, in the node_exporter textfile collector format; the rename keeps readers off a partial file
+    partial_path = f"{path}.tmp"
+    with open(partial_path, "w") as f:
+        f.write((registry or REGISTRY).render())
+    os.replace(partial_path, path)
+
+class Registry:
+    
+    def __init__(self):
+        self._metrics = []
+    
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+QUERY_REQUESTS = REGISTRY.register(Counter(
+    "rag_query_requests_total", "Query requests by endpoint, retrieval mode and outcome",
+    ("endpoint", "mode", "status")
+))
+QUERY_LATENCY = REGISTRY.register(Histogram(
+    "rag_query_duration_seconds", "End-to-end query latency", ("endpoint",)
+))
+QUERY_STAGE_LATENCY = REGISTRY.register(Histogram(
+    "rag_query_stage_duration_seconds", "Latency of each query pipeline stage, per request or per batch",
+    ("stage", "scope")
+))
+PROMPT_TOKENS = REGISTRY.register(Counter(
+    "rag_prompt_tokens_total", "Estimated context prompt tokens as retrieved and after packing", ("stage",)
+))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "rag_startup_seconds", "Duration of each startup phase; ready is the process age when it began serving", ("phase",)
+))
+PROCESS_MEMORY = REGISTRY.register(Gauge(
+    "rag_process_memory_bytes", "Memory of this worker process (rss, pss, uss, shared)", ("kind",)
+))
+CACHE_HITS = REGISTRY.register(Counter("rag_cache_hits_total", "Cache hits", ("level",)))
+CACHE_MISSES = REGISTRY.register(Counter("rag_cache_misses_total", "Cache misses", ("level",)))
+CACHE_ENTRIES = REGISTRY.register(Gauge("rag_cache_entries", "Entries currently cached", ("level",)))
+EMBEDDING_BATCH_ITEMS = REGISTRY.register(Counter(
+    "rag_embedding_batched_questions_total", "Questions encoded by the micro-batcher"
+))
+EMBEDDING_BATCHES = REGISTRY.register(Counter(
+    "rag_embedding_batches_total", "Forward passes run by the micro-batcher"
+))
+GENERATION_REQUESTS = REGISTRY.register(Counter(
+    "rag_generation_requests_total", "LLM generation calls by outcome (ok, shed, timeout, error)", ("outcome",)
+))
+GENERATION_RETRIES = REGISTRY.register(Counter(
+    "rag_generation_retries_total", "LLM generation attempts retried after a transient failure"
+))
+GENERATION_HEDGES = REGISTRY.register(Counter(
+    "rag_generation_hedges_total", "Hedged LLM calls sent, and how many answered first", ("result",)
+))
+RERANK_REQUESTS = REGISTRY.register(Counter(
+    "rag_rerank_requests_total", "Rerank stage outcomes (reranked, skipped over budget, busy, timeout, error)",
+    ("outcome",)
+))
+RERANK_PAIRS = REGISTRY.register(Counter(
+    "rag_rerank_pairs_total", "Question-chunk pairs reranked, by whether the score was cached or computed", ("result",)
+))
+VECTOR_SHARD_REQUESTS = REGISTRY.register(Counter(
+    "rag_vector_shard_requests_total", "Vector store calls per shard by outcome (ok, timeout, busy, error)",
+    ("shard", "outcome")
+))
+VECTOR_SHARD_LATENCY = REGISTRY.register(Histogram(
+    "rag_vector_shard_duration_seconds", "Latency of successful vector store calls per shard", ("shard",)
+))
+VECTOR_PARTIAL_RESULTS = REGISTRY.register(Counter(
+    "rag_vector_partial_results_total", "Vector reads answered without every shard"
+))
+GENERATION_INFLIGHT = REGISTRY.register(Gauge("rag_generation_inflight", "LLM calls currently in flight"))
+GENERATION_QUEUED = REGISTRY.register(Gauge("rag_generation_queued", "Requests waiting for a generation slot"))
+
+INGEST_STAGE_LATENCY = REGISTRY.register(Histogram(
+    "rag_ingest_stage_duration_seconds", "Per-document latency of each ingestion stage", ("stage",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+))
+INGEST_DOCUMENTS = REGISTRY.register(Counter(
+    "rag_ingest_documents_total", "Documents ingested, skipped or removed", ("result",)
+))
+INGEST_EMBEDDING_CACHE = REGISTRY.register(Counter(
+    "rag_ingest_embedding_cache_total", "Chunk embedding cache lookups during ingestion", ("result",)
+))
+INGEST_FAILURES = REGISTRY.register(Counter(
+    "rag_ingest_failures_total", "Ingestion failures by stage", ("stage",)
+))
@@ -0,0 +1,60 @@
+import os
+import threading
+import time
+import numpy as np
+from typing import List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def rerank_enabled() -> bool:
+    return os.getenv("RERANK_ENABLED", "false").lower() == "true"
+
+class CrossEncoderReranker:
+    
+    def __init__(self, model_name: str = None, batch_size: int = None, max_length: int = None,
+                 candidate_multiplier: int = None, max_candidates: int = None, budget_ms: float = None):
+        self.model_name = model_name or os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.batch_size = batch_size or int(os.getenv("RERANK_BATCH_SIZE", "32"))
+        self.max_length = max_length or int(os.getenv("RERANK_MAX_LENGTH", "256"))
+        self.candidate_multiplier = candidate_multiplier or int(os.getenv("RERANK_CANDIDATE_MULTIPLIER", "4"))
+        self.max_candidates = max_candidates or int(os.getenv("RERANK_MAX_CANDIDATES", "40"))
+        self.budget = (budget_ms or float(os.getenv("RERANK_BUDGET_MS", "300"))) / 1000
+        self.seconds_per_pair = 0.0
+        self.model = None
+        self._lock = threading.Lock()
+    
+    def load(self) -> "CrossEncoderReranker":
+        from sentence_transformers import CrossEncoder
+        
+        self.model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self
+    
+    def candidate_depth(self, top_k: int) -> int:
+        return max(min(top_k * self.candidate_multiplier, self.max_candidates), top_k)
+    
+    def estimate_seconds(self, pairs: int) -> float:
+        return self.seconds_per_pair * pairs
+    
+    def predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        return self.model.predict(pairs, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+    
+    def score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        
+        # Similar lengths in one batch keep padding small, as for the embedding model
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][1]), reverse=True)
+        started = time.perf_counter()
+        predicted = self.predict([pairs[i] for i in order])
+        elapsed = time.perf_counter() - started
+        
+        scores = [0.0] * len(pairs)
+        for i, score in zip(order, predicted):
+            scores[i] = float(score)
+        
+        # A moving average of the per-pair cost decides whether the next call fits in the budget
+        per_pair = elapsed / len(pairs)
+        with self._lock:
+            self.seconds_per_pair = 0.8 * self.seconds_per_pair + 0.2 * per_pair if self.seconds_per_pair else per_pair
+        return scores
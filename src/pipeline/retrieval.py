@@ -0,0 +1,46 @@
+import numpy as np
+from typing import List, Dict, Optional
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    
+    return sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)
+
+def build_where(filters: Dict) -> Optional[Dict]:
+    clauses = []
+    if filters.get("filename"):
+        clauses.append({"filename": filters["filename"]})
+    if filters.get("section_title"):
+        # "section" is the title without the "(Part n)" suffix long sections get
+        clauses.append({"$or": [{"section": filters["section_title"]}, {"section_title": filters["section_title"]}]})
+    if filters.get("page_from") is not None:
+        clauses.append({"page_end": {"$gte": filters["page_from"]}})
+    if filters.get("page_to") is not None:
+        clauses.append({"page_num": {"$lte": filters["page_to"]}})
+    
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def maximal_marginal_relevance(query_embedding: List[float], embeddings: List[List[float]],
+                               lambda_mult: float = 0.7) -> List[int]:
+    if not embeddings:
+        return []
+    
+    query = np.asarray(query_embedding, dtype=np.float32)
+    docs = np.asarray(embeddings, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    docs = docs / np.maximum(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12)
+    relevance = docs @ query
+    similarity = docs @ docs.T
+    
+    order = [int(np.argmax(relevance))]
+    remaining = [i for i in range(len(docs)) if i != order[0]]
+    while remaining:
+        redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        order.append(remaining.pop(int(np.argmax(scores))))
+    return order
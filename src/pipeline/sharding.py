@@ -0,0 +1,338 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from . import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "document_chunks"
+COLLECTION_METADATA = {"description": "Document chunks for RAG system"}
+
+def jump_hash(key: int, buckets: int) -> int:
+    # Jump consistent hash: going from n to n + 1 shards moves only 1/(n + 1) of the documents
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+def shard_for(filename: str, shards: int) -> int:
+    # Routing by document keeps a paper's chunks together, so per-file deletes and filters touch one shard
+    return jump_hash(int.from_bytes(hashlib.sha256(filename.encode("utf-8")).digest()[:8], "big"), shards)
+
+def collection_name(shard: int) -> str:
+    # Shard 0 keeps the unsharded name, so the first split leaves most documents where they are
+    return COLLECTION_NAME if shard == 0 else f"{COLLECTION_NAME}_{shard}"
+
+def shard_index(name: str) -> Optional[int]:
+    if name == COLLECTION_NAME:
+        return 0
+    prefix, _, suffix = name.rpartition("_")
+    return int(suffix) if prefix == COLLECTION_NAME and suffix.isdigit() else None
+
+def set_request_timeout(client, seconds: float):
+    # The Chroma client sends requests without a timeout, so a hung shard would hold a thread forever
+    session = getattr(client, "_server", client)._session
+    if hasattr(session, "mount"):
+        from requests.adapters import HTTPAdapter
+        
+        class TimeoutAdapter(HTTPAdapter):
+            
+            def send(self, request, timeout=None, **kwargs):
+                return super().send(request, timeout=timeout or seconds, **kwargs)
+        
+        session.mount("http://", TimeoutAdapter())
+        session.mount("https://", TimeoutAdapter())
+    else:
+        session.timeout = seconds
+
+def chroma_hosts(default_host: str = "localhost") -> List[Tuple[str, int]]:
+    default_port = int(os.getenv("CHROMA_PORT", "8000"))
+    configured = [entry.strip() for entry in os.getenv("CHROMA_SHARD_HOSTS", "").split(",") if entry.strip()]
+    if not configured:
+        return [(os.getenv("CHROMA_HOST", default_host), default_port)]
+    
+    hosts = []
+    for entry in configured:
+        host, _, port = entry.rpartition(":") if ":" in entry else (entry, "", "")
+        hosts.append((host, int(port) if port else default_port))
+    return hosts
+
+class ChromaShards:
+    
+    def __init__(self, shards: int = None, hosts: List[Tuple[str, int]] = None, timeout_ms: float = None,
+                 workers: int = None):
+        self.shards = shards or int(os.getenv("VECTOR_SHARDS", "1"))
+        self.hosts = hosts or chroma_hosts()
+        self.timeout = (timeout_ms or float(os.getenv("VECTOR_SHARD_TIMEOUT_MS", "500"))) / 1000
+        self.workers = workers or int(os.getenv("VECTOR_SHARD_WORKERS") or 4 * self.shards)
+        self.http_timeout = float(os.getenv("VECTOR_SHARD_HTTP_TIMEOUT_S", "30"))
+        # One slow shard may only tie up its share of the pool; further reads skip it instead of queueing
+        max_inflight = int(os.getenv("VECTOR_SHARD_MAX_INFLIGHT") or max(1, self.workers // self.shards))
+        self.slots = [threading.BoundedSemaphore(max_inflight) for _ in range(self.shards)]
+        self.clients = {}
+        self.collections = [None] * self.shards
+        self.executor = None
+        self._lock = threading.Lock()
+    
+    def host_for(self, shard: int) -> Tuple[str, int]:
+        return self.hosts[shard % len(self.hosts)]
+    
+    def client(self, host: Tuple[str, int]):
+        import chromadb
+        
+        with self._lock:
+            if host not in self.clients:
+                self.clients[host] = chromadb.HttpClient(host=host[0], port=host[1])
+                set_request_timeout(self.clients[host], self.http_timeout)
+            return self.clients[host]
+    
+    def collection(self, shard: int):
+        # A shard that was down at startup is retried on the next call that needs it
+        if self.collections[shard] is None:
+            self.collections[shard] = self.client(self.host_for(shard)).get_or_create_collection(
+                name=collection_name(shard), metadata=COLLECTION_METADATA
+            )
+        return self.collections[shard]
+    
+    def connect(self) -> "ChromaShards":
+        failed = []
+        for shard in range(self.shards):
+            try:
+                self.collection(shard)
+            except Exception:
+                if self.shards == 1:
+                    raise
+                logger.warning("Vector shard %d at %s:%d is unavailable", shard, *self.host_for(shard), exc_info=True)
+                failed.append(shard)
+        if len(failed) == self.shards:
+            raise RuntimeError("No vector shard is reachable")
+        return self
+    
+    def shards_for(self, where: Dict = None) -> List[int]:
+        # Every chunk of a document sits on its filename's shard, so a filter on one filename needs only that shard
+        clauses = where.get("$and", [where]) if where else []
+        for clause in clauses:
+            filename = clause.get("filename")
+            filename = filename.get("$eq") if isinstance(filename, dict) else filename
+            if isinstance(filename, str):
+                return [shard_for(filename, self.shards)]
+        return list(range(self.shards))
+    
+    def _call(self, shard: int, call: Callable):
+        started = time.perf_counter()
+        try:
+            result = call(self.collection(shard))
+        except Exception:
+            metrics.VECTOR_SHARD_REQUESTS.inc(shard=shard, outcome="error")
+            raise
+        metrics.VECTOR_SHARD_LATENCY.observe(time.perf_counter() - started, shard=shard)
+        metrics.VECTOR_SHARD_REQUESTS.inc(shard=shard, outcome="ok")
+        return result
+    
+    def _scatter(self, call: Callable, shards: List[int] = None, partial: bool = False) -> Dict[int, object]:
+        shards = list(range(self.shards)) if shards is None else shards
+        if len(shards) == 1 and not partial:
+            # A write or scan waits for its one shard anyway; reads still need the slot and the deadline
+            return {shards[0]: self._call(shards[0], call)}
+        
+        if self.executor is None:
+            with self._lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vector-shard")
+        
+        # Reads answer from the shards that made the deadline; writes and scans wait for every shard
+        futures = {}
+        for shard in shards:
+            if not self.slots[shard].acquire(blocking=not partial):
+                metrics.VECTOR_SHARD_REQUESTS.inc(shard=shard, outcome="busy")
+                continue
+            future = self.executor.submit(self._call, shard, call)
+            future.add_done_callback(lambda _, slots=self.slots[shard]: slots.release())
+            futures[future] = shard
+        done, pending = wait(futures, timeout=self.timeout if partial else None) if futures else (set(), set())
+        
+        results, error = {}, None
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                logger.warning("Vector shard %d failed: %r", futures[future], e)
+                error = error or e
+        for future in pending:
+            # Only a call still queued is cancelled; a running one ends at the HTTP timeout at the latest
+            future.cancel()
+            metrics.VECTOR_SHARD_REQUESTS.inc(shard=futures[future], outcome="timeout")
+        
+        if error is not None and not partial:
+            raise error
+        if not results:
+            raise error or TimeoutError(f"No vector shard answered within {self.timeout * 1000:.0f} ms")
+        if len(results) < len(shards):
+            metrics.VECTOR_PARTIAL_RESULTS.inc()
+        return results
+    
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Dict = None,
+              include: List[str] = None) -> Dict:
+        include = list(include) if include is not None else ["metadatas", "documents", "distances"]
+        if "distances" not in include:
+            include.append("distances")
+        
+        # Each shard returns a full top-k, so the merged top-k is exact over the shards that answered
+        shards = self.shards_for(where)
+        responses = self._scatter(lambda collection: collection.query(
+            query_embeddings=query_embeddings, n_results=n_results, where=where, include=include
+        ), shards, partial=True)
+        
+        fields = ["ids"] + include
+        merged = {field: [] for field in fields}
+        for q in range(len(query_embeddings)):
+            best = {}
+            for response in responses.values():
+                for position, chunk_id in enumerate(response["ids"][q]):
+                    distance = response["distances"][q][position]
+                    # During a rebalance a document can briefly sit on two shards
+                    if chunk_id not in best or distance < best[chunk_id][0]:
+                        best[chunk_id] = (distance, response, position)
+            ranked = sorted(best.values(), key=lambda entry: entry[0])[:n_results]
+            for field in fields:
+                merged[field].append([response[field][q][position] for _, response, position in ranked])
+        merged["partial"] = len(responses) < len(shards)
+        return merged
+    
+    def get(self, ids: List[str] = None, where: Dict = None, include: List[str] = None) -> Dict:
+        include = include if include is not None else ["metadatas", "documents"]
+        # Chunk ids do not name their shard; a lookup by id may come back partial, a filter scan may not
+        responses = self._scatter(
+            lambda collection: collection.get(ids=ids, where=where, include=include), self.shards_for(where),
+            partial=ids is not None
+        )
+        
+        merged = {"ids": []}
+        merged.update({field: [] for field in include})
+        for response in responses.values():
+            for field in merged:
+                values = response.get(field)
+                merged[field].extend(values if values is not None else [])
+        return merged
+    
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict] = None,
+               documents: List[str] = None):
+        metadatas = metadatas or [{} for _ in ids]
+        rows_by_shard = {}
+        for row, (chunk_id, metadata) in enumerate(zip(ids, metadatas)):
+            rows_by_shard.setdefault(shard_for(metadata.get("filename") or chunk_id, self.shards), []).append(row)
+        
+        def upsert_rows(shard: int):
+            rows = rows_by_shard[shard]
+            return lambda collection: collection.upsert(
+                ids=[ids[row] for row in rows],
+                embeddings=[embeddings[row] for row in rows],
+                metadatas=[metadatas[row] for row in rows],
+                documents=[documents[row] for row in rows] if documents is not None else None
+            )
+        
+        for shard in rows_by_shard:
+            self._scatter(upsert_rows(shard), [shard])
+    
+    def delete(self, ids: List[str] = None, where: Dict = None):
+        if ids is not None and not ids:
+            return
+        self._scatter(lambda collection: collection.delete(ids=ids, where=where), self.shards_for(where))
+    
+    def count(self) -> int:
+        return sum(self._scatter(lambda collection: collection.count()).values())
+    
+    def clear(self):
+        for shard in range(self.shards):
+            client = self.client(self.host_for(shard))
+            try:
+                client.delete_collection(collection_name(shard))
+            except Exception:
+                pass  # Collection might not exist
+            self.collections[shard] = None
+            self.collection(shard)
+
+def rebalance(store: ChromaShards, batch_size: int = None, dry_run: bool = False) -> Dict:
+    batch_size = batch_size or int(os.getenv("CHROMA_BATCH_SIZE", "256"))
+    report = {"shards": store.shards, "scanned": 0, "moved": 0, "moves": {}, "dropped_collections": []}
+    
+    # Every shard collection on every configured host is a source, including ones beyond the new shard count
+    for host in store.hosts:
+        client = store.client(host)
+        for listed in client.list_collections():
+            name = getattr(listed, "name", listed)
+            source = shard_index(name)
+            if source is None:
+                continue
+            
+            collection = client.get_collection(name)
+            moves = {}
+            offset = 0
+            while True:
+                page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+                report["scanned"] += len(page["ids"])
+                for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+                    target = shard_for((metadata or {}).get("filename") or chunk_id, store.shards)
+                    if (store.host_for(target), collection_name(target)) != (host, name):
+                        moves.setdefault(target, []).append(chunk_id)
+            
+            for target, chunk_ids in moves.items():
+                destination = "{}:{}/{}".format(*store.host_for(target), collection_name(target))
+                report["moves"][f"{host[0]}:{host[1]}/{name} -> {destination}"] = len(chunk_ids)
+                report["moved"] += len(chunk_ids)
+                if dry_run:
+                    continue
+                # Copy before delete: an interrupted run leaves duplicates, which queries merge and a rerun clears
+                for start in range(0, len(chunk_ids), batch_size):
+                    rows = collection.get(
+                        ids=chunk_ids[start:start + batch_size], include=["embeddings", "metadatas", "documents"]
+                    )
+                    store.collection(target).upsert(
+                        ids=rows["ids"], embeddings=rows["embeddings"], metadatas=rows["metadatas"],
+                        documents=rows["documents"]
+                    )
+                    collection.delete(ids=rows["ids"])
+            
+            retired = source >= store.shards or store.host_for(source) != host
+            if retired and not dry_run and collection.count() == 0:
+                client.delete_collection(name)
+                report["dropped_collections"].append(f"{host[0]}:{host[1]}/{name}")
+    return report
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Manage the sharded Chroma vector store")
+    parser.add_argument("command", choices=["rebalance", "status"])
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    store = ChromaShards(shards=args.shards)
+    if args.command == "rebalance":
+        print(json.dumps(rebalance(store, args.batch_size, args.dry_run), indent=2))
+    else:
+        store.connect()
+        print(json.dumps({
+            f"{store.host_for(shard)[0]}:{store.host_for(shard)[1]}/{collection_name(shard)}":
+                store.collection(shard).count()
+            for shard in range(store.shards)
+        }, indent=2))
+
+if __name__ == "__main__":
+    main()
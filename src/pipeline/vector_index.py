@@ -0,0 +1,449 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand
+}
+
+def matches_where(metadata: Dict, where: Dict) -> bool:
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if not _OPERATORS[operator](value, operand):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+def _equality(where: Dict, key: str):
+    if not where:
+        return None
+    
+    condition = where.get(key)
+    if condition is not None:
+        return condition.get("$eq") if isinstance(condition, dict) else condition
+    for clause in where.get("$and", []):
+        value = _equality(clause, key)
+        if value is not None:
+            return value
+    return None
+
+class _IndexState:
+    
+    def __init__(self, ids: List[str], metadatas: List[Dict], vectors: np.ndarray, norms: np.ndarray,
+                 live: np.ndarray = None, ivf: Dict = None, version: str = None):
+        self.ids = ids
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self.norms = norms
+        self.live = live
+        self.ivf = ivf
+        self.version = version
+        self.size = len(ids)
+        self.masks = {}
+        self.positions = None
+        self.filename_rows = None
+
+class LocalVectorIndex:
+    
+    def __init__(self, path: str = None, dtype: str = None, ivf_threshold: int = None,
+                 nlist: int = None, nprobe: int = None, keep_snapshots: int = None):
+        self.path = path or os.getenv("VECTOR_INDEX_PATH", "/app/data/vector_index")
+        self.dtype = np.dtype(dtype or os.getenv("VECTOR_INDEX_DTYPE", "float32"))
+        self.ivf_threshold = ivf_threshold if ivf_threshold is not None else \
+            int(os.getenv("VECTOR_INDEX_IVF_THRESHOLD", "50000"))
+        self.nlist = nlist or int(os.getenv("VECTOR_INDEX_NLIST", "0"))
+        self.nprobe = nprobe or int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+        self.keep_snapshots = keep_snapshots or int(os.getenv("VECTOR_INDEX_KEEP_SNAPSHOTS", "2"))
+        self.block_size = int(os.getenv("VECTOR_INDEX_BLOCK_SIZE", "65536"))
+        self.writable = False
+        self._state = _IndexState([], [], np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.float32))
+        self._rows = {}
+        self._lock = threading.Lock()
+    
+    def _current_snapshot(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def load(self, writable: bool = False) -> "LocalVectorIndex":
+        self.writable = writable
+        snapshot = self._current_snapshot()
+        state = self._read_snapshot(snapshot) if snapshot else \
+            _IndexState([], [], np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.float32))
+        
+        if writable:
+            # Writers work on a private in-RAM copy; readers keep sharing the mapped snapshot
+            state.vectors = np.array(state.vectors, dtype=np.float32)
+            state.norms = np.array(state.norms, dtype=np.float32)
+            state.live = np.ones(state.size, dtype=bool)
+            state.ids = list(state.ids)
+            state.metadatas = list(state.metadatas)
+            state.ivf = None
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(state.ids)}
+        
+        with self._lock:
+            self._state = state
+        return self
+    
+    @property
+    def snapshot_version(self) -> Optional[str]:
+        return self._state.version
+    
+    def reload_if_changed(self) -> bool:
+        snapshot = self._current_snapshot()
+        if snapshot is None or snapshot == self._state.version:
+            return False
+        if self.writable:
+            # Another writer published since this copy was loaded; call only under writer_lock with nothing unpublished
+            self.load(writable=True)
+            return True
+        
+        state = self._read_snapshot(snapshot)
+        with self._lock:
+            self._state = state
+        return True
+    
+    def _read_snapshot(self, snapshot: str) -> _IndexState:
+        directory = os.path.join(self.path, snapshot)
+        with open(os.path.join(directory, "ids.json")) as f:
+            ids = json.load(f)
+        with open(os.path.join(directory, "metadatas.json")) as f:
+            metadatas = json.load(f)
+        
+        # mmap_mode="r" lets every worker process share one copy through the page cache
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        norms = np.load(os.path.join(directory, "norms.npy"), mmap_mode="r")
+        
+        ivf = None
+        if os.path.exists(os.path.join(directory, "ivf_centroids.npy")):
+            ivf = {
+                "centroids": np.load(os.path.join(directory, "ivf_centroids.npy")),
+                "order": np.load(os.path.join(directory, "ivf_order.npy"), mmap_mode="r"),
+                "offsets": np.load(os.path.join(directory, "ivf_offsets.npy"))
+            }
+        
+        return _IndexState(ids, metadatas, vectors, norms, ivf=ivf, version=snapshot)
+    
+    def snapshot(self) -> str:
+        with self._lock:
+            state = self._state
+            live = state.live[:state.size] if state.live is not None else np.ones(state.size, dtype=bool)
+            rows = np.flatnonzero(live)
+            ids = [state.ids[row] for row in rows]
+            metadatas = [state.metadatas[row] for row in rows]
+            vectors = np.ascontiguousarray(state.vectors[rows]) if state.size else \
+                np.zeros((0, 0), dtype=np.float32)
+        
+        os.makedirs(self.path, exist_ok=True)
+        snapshot = f"snapshot-{time.time_ns()}"
+        staging = os.path.join(self.path, f".{snapshot}")
+        os.makedirs(staging)
+        
+        stored = vectors.astype(self.dtype)
+        np.save(os.path.join(staging, "vectors.npy"), stored)
+        np.save(os.path.join(staging, "norms.npy"), _squared_norms(stored))
+        with open(os.path.join(staging, "ids.json"), "w") as f:
+            json.dump(ids, f)
+        with open(os.path.join(staging, "metadatas.json"), "w") as f:
+            json.dump(metadatas, f)
+        
+        if self.ivf_threshold and len(ids) >= self.ivf_threshold:
+            nlist = self.nlist or int(np.sqrt(len(ids)))
+            centroids, order, offsets = _build_ivf(stored, nlist, self.block_size)
+            np.save(os.path.join(staging, "ivf_centroids.npy"), centroids)
+            np.save(os.path.join(staging, "ivf_order.npy"), order)
+            np.save(os.path.join(staging, "ivf_offsets.npy"), offsets)
+        
+        os.replace(staging, os.path.join(self.path, snapshot))
+        pointer = os.path.join(self.path, "CURRENT.tmp")
+        with open(pointer, "w") as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, os.path.join(self.path, "CURRENT"))
+        if self.writable:
+            state.version = snapshot
+        
+        # Readers that still map an older snapshot keep working after the unlink
+        snapshots = sorted(name for name in os.listdir(self.path) if name.startswith("snapshot-"))
+        for name in snapshots[:-self.keep_snapshots]:
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        
+        return snapshot
+    
+    @contextmanager
+    def writer_lock(self):
+        # Every snapshot holds the whole index, so two processes writing at once would lose one's documents
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "LOCK"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Waiting for another writer of %s", self.path)
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def count(self) -> int:
+        state = self._state
+        if state.live is None:
+            return state.size
+        return int(state.live[:state.size].sum())
+    
+    def _require_writable(self):
+        if not self.writable:
+            raise RuntimeError("LocalVectorIndex was loaded read-only")
+    
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict] = None,
+               documents: List[str] = None):
+        self._require_writable()
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        metadatas = metadatas or [{} for _ in ids]
+        
+        with self._lock:
+            state = self._state
+            if state.vectors.shape[1] != vectors.shape[1]:
+                if state.size:
+                    raise ValueError(f"Expected {state.vectors.shape[1]}-d embeddings, got {vectors.shape[1]}")
+                state.vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            
+            new_ids = [chunk_id for chunk_id in ids if chunk_id not in self._rows]
+            self._reserve(state, state.size + len(new_ids))
+            
+            for chunk_id, vector, metadata in zip(ids, vectors, metadatas):
+                row = self._rows.get(chunk_id)
+                if row is None:
+                    row = state.size
+                    self._rows[chunk_id] = row
+                    state.ids.append(chunk_id)
+                    state.metadatas.append(metadata)
+                    state.size += 1
+                else:
+                    state.metadatas[row] = metadata
+                state.vectors[row] = vector
+                state.norms[row] = float(vector @ vector)
+                state.live[row] = True
+            state.masks = {}
+            state.filename_rows = None
+    
+    def _reserve(self, state: _IndexState, size: int):
+        capacity = len(state.vectors)
+        if size <= capacity:
+            return
+        
+        capacity = max(size, capacity * 2, 1024)
+        vectors = np.zeros((capacity, state.vectors.shape[1]), dtype=np.float32)
+        vectors[:state.size] = state.vectors[:state.size]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:state.size] = state.norms[:state.size]
+        live = np.zeros(capacity, dtype=bool)
+        live[:state.size] = state.live[:state.size]
+        state.vectors, state.norms, state.live = vectors, norms, live
+    
+    def delete(self, ids: List[str] = None, where: Dict = None):
+        self._require_writable()
+        if ids is None:
+            ids = self.get(where=where)["ids"]
+        
+        with self._lock:
+            state = self._state
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is not None:
+                    state.live[row] = False
+            state.masks = {}
+            state.filename_rows = None
+    
+    def get(self, ids: List[str] = None, where: Dict = None, include: List[str] = None) -> Dict:
+        state = self._state
+        if ids is not None:
+            positions = self._rows if self.writable else self._positions(state)
+            rows = [positions[chunk_id] for chunk_id in ids if chunk_id in positions]
+            if where:
+                rows = [row for row in rows if matches_where(state.metadatas[row], where)]
+        else:
+            rows = np.flatnonzero(self._mask(state, where)).tolist()
+        
+        results = {
+            "ids": [state.ids[row] for row in rows],
+            "metadatas": [state.metadatas[row] for row in rows]
+        }
+        if include and "embeddings" in include:
+            results["embeddings"] = np.asarray(state.vectors[rows], dtype=np.float32).tolist()
+        return results
+    
+    def _positions(self, state: _IndexState) -> Dict[str, int]:
+        # Built once per loaded snapshot; read-only states never change after load
+        if state.positions is None:
+            state.positions = {chunk_id: row for row, chunk_id in enumerate(state.ids[:state.size])}
+        return state.positions
+    
+    def _mask(self, state: _IndexState, where: Dict = None) -> np.ndarray:
+        live = state.live[:state.size] if state.live is not None else np.ones(state.size, dtype=bool)
+        if not where:
+            return live
+        
+        key = json.dumps(where, sort_keys=True)
+        mask = state.masks.get(key)
+        if mask is None:
+            mask = np.fromiter(
+                (matches_where(metadata, where) for metadata in state.metadatas[:state.size]),
+                dtype=bool, count=state.size
+            )
+            if len(state.masks) >= 256:
+                state.masks.clear()
+            state.masks[key] = mask
+        return mask & live
+    
+    def _filter_rows(self, state: _IndexState, where: Dict) -> np.ndarray:
+        filename = _equality(where, "filename")
+        if filename is None:
+            return np.flatnonzero(self._mask(state, where))
+        
+        # A per-file row list makes a filter on one paper cost that paper's size, not the corpus'
+        if state.filename_rows is None:
+            rows_by_filename = {}
+            for row, metadata in enumerate(state.metadatas[:state.size]):
+                rows_by_filename.setdefault(metadata.get("filename"), []).append(row)
+            state.filename_rows = {name: np.asarray(rows, dtype=np.int64) for name, rows in rows_by_filename.items()}
+        
+        rows = state.filename_rows.get(filename, np.zeros(0, dtype=np.int64))
+        if state.live is not None:
+            rows = rows[state.live[rows]]
+        return np.asarray([row for row in rows if matches_where(state.metadatas[row], where)], dtype=np.int64)
+    
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Dict = None,
+              include: List[str] = None) -> Dict:
+        include = include if include is not None else ["metadatas", "distances"]
+        state = self._state
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        
+        results = {"ids": [], "distances": [], "metadatas": [], "embeddings": [] if "embeddings" in include else None}
+        if state.size == 0:
+            for _ in queries:
+                results["ids"].append([])
+                results["distances"].append([])
+                results["metadatas"].append([])
+                if results["embeddings"] is not None:
+                    results["embeddings"].append([])
+            return results
+        
+        if where:
+            filtered_rows = self._filter_rows(state, where)
+        elif state.live is not None:
+            filtered_rows = np.flatnonzero(self._mask(state))
+        else:
+            filtered_rows = None
+        
+        for query in queries:
+            if state.ivf is not None and filtered_rows is None:
+                rows = self._ivf_candidates(state, query)
+            else:
+                rows = filtered_rows
+            top_rows, distances = self._exact_top_k(state, query, n_results, rows)
+            
+            results["ids"].append([state.ids[row] for row in top_rows])
+            results["distances"].append(distances.tolist())
+            results["metadatas"].append([state.metadatas[row] for row in top_rows])
+            if results["embeddings"] is not None:
+                results["embeddings"].append(np.asarray(state.vectors[top_rows], dtype=np.float32).tolist())
+        
+        return results
+    
+    def _ivf_candidates(self, state: _IndexState, query: np.ndarray) -> np.ndarray:
+        centroids = state.ivf["centroids"]
+        distances = np.sum(centroids * centroids, axis=1) - 2 * centroids @ query
+        probes = np.argsort(distances)[:self.nprobe]
+        order, offsets = state.ivf["order"], state.ivf["offsets"]
+        return np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes])
+    
+    def _exact_top_k(self, state: _IndexState, query: np.ndarray, k: int, rows: np.ndarray = None):
+        query_norm = float(query @ query)
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_distances = np.zeros(0, dtype=np.float32)
+        
+        total = state.size if rows is None else len(rows)
+        # Blocks bound the float32 working set when the mapped vectors are float16
+        for start in range(0, total, self.block_size):
+            if rows is None:
+                end = min(start + self.block_size, total)
+                block_rows = np.arange(start, end)
+                block = np.asarray(state.vectors[start:end], dtype=np.float32)
+                norms = np.asarray(state.norms[start:end], dtype=np.float32)
+            else:
+                block_rows = np.asarray(rows[start:start + self.block_size])
+                block = np.asarray(state.vectors[block_rows], dtype=np.float32)
+                norms = np.asarray(state.norms[block_rows], dtype=np.float32)
+            distances = norms - 2 * (block @ query) + query_norm
+            
+            best_rows = np.concatenate([best_rows, block_rows])
+            best_distances = np.concatenate([best_distances, distances])
+            if len(best_rows) > k:
+                keep = np.argpartition(best_distances, k)[:k]
+                best_rows, best_distances = best_rows[keep], best_distances[keep]
+        
+        order = np.argsort(best_distances)[:k]
+        return best_rows[order], np.maximum(best_distances[order], 0.0)
+
+def _squared_norms(vectors: np.ndarray) -> np.ndarray:
+    as_float = np.asarray(vectors, dtype=np.float32)
+    return np.einsum("ij,ij->i", as_float, as_float) if len(as_float) else np.zeros(0, dtype=np.float32)
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, block_size: int) -> np.ndarray:
+    centroid_norms = np.sum(centroids * centroids, axis=1)
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return assignments
+
+def _build_ivf(vectors: np.ndarray, nlist: int, block_size: int, iterations: int = 10):
+    rng = np.random.default_rng(0)
+    nlist = max(1, min(nlist, len(vectors)))
+    sample_rows = rng.choice(len(vectors), size=min(len(vectors), nlist * 256), replace=False)
+    sample = np.asarray(vectors[np.sort(sample_rows)], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    
+    for _ in range(iterations):
+        assignments = _nearest_centroids(sample, centroids, block_size)
+        for c in range(nlist):
+            members = sample[assignments == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    
+    assignments = _nearest_centroids(vectors, centroids, block_size)
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+    return centroids, order, offsets
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import httpx
+import pytest
+from src import main as api
+from src.benchmarks.fakes import HashingEmbedder
+from src.benchmarks.run import bench_ingestion
+from src.pipeline.batching import EmbeddingBatcher
+from src.pipeline.cache import QueryCache
+from src.pipeline.context import ContextPacker
+from src.pipeline.generation import GenerationClient, StubLLM
+
+DOCUMENTS = [
+    ("attention.pdf", [
+        {"text": "Attention weighs every token against every other token.", "chunk_index": 0,
+         "section_title": "Attention", "page_num": 1},
+        {"text": "Multi-head attention runs several attention functions in parallel.", "chunk_index": 1,
+         "section_title": "Attention", "page_num": 2},
+    ]),
+]
+
+@pytest.fixture
+def serve(tmp_path):
+    def serve(llm):
+        embedder = HashingEmbedder()
+        _, vector_store, chunk_store = bench_ingestion(DOCUMENTS, embedder, str(tmp_path))
+        api.embedding_executor = ThreadPoolExecutor(2)
+        api.io_executor = ThreadPoolExecutor(4)
+        api.chunk_store = chunk_store
+        api.vector_store = vector_store
+        api.embedder = embedder
+        api.reranker = None
+        api.generation_client = GenerationClient(llm, max_retries=2, retry_base_ms=1, retry_max_ms=1)
+        api.query_cache = QueryCache()
+        api.context_packer = ContextPacker()
+        api.embedding_batcher = EmbeddingBatcher(api.encode_questions, api.embedding_executor)
+        api.ready = True
+        return post
+    
+    def post(path, body):
+        # The ASGI transport skips the lifespan, which would connect to the real stores
+        async def send():
+            api.embedding_batcher.start()
+            transport = httpx.ASGITransport(app=api.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                    return await http.post(path, json=body)
+            finally:
+                await api.embedding_batcher.stop()
+        return asyncio.run(send())
+    
+    yield serve
+    api.embedding_executor.shutdown()
+    api.io_executor.shutdown()
+
+def test_query_reports_exhausted_retries_as_bad_gateway(serve):
+    post = serve(StubLLM(1, 0, seed=0, error_rate=1.0))
+    response = post("/query", {"question": "How does attention work?"})
+    
+    assert response.status_code == 502
+    assert "LLM unavailable" in response.json()["detail"]
+
+def test_batch_reports_exhausted_retries_as_bad_gateway(serve):
+    post = serve(StubLLM(1, 0, seed=0, error_rate=1.0))
+    response = post("/query/batch", {"questions": ["How does attention work?", "What is multi-head attention?"]})
+    
+    assert response.status_code == 502
+
+def test_query_answers_when_generation_succeeds(serve):
+    post = serve(StubLLM(1, 0, seed=0))
+    response = post("/query", {"question": "How does attention work?"})
+    
+    assert response.status_code == 200
+    assert response.json()["sources"]
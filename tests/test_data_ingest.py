@@ -0,0 +1,37 @@
+import fitz
+import pytest
+from src.pipeline.data_ingest import PDFProcessor
+
+BODY = ("Vision language models combine an image encoder with a language model and are trained on paired data, "
+        "which lets them answer questions about pictures, describe scenes and follow visual instructions.")
+
+def write_title_page(path, title):
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 60
+    for text, size, font in [(title, 16, "hebo"),
+                             ("Jane Doe Alex Smith Sam Lee", 12, "hebo"),
+                             ("{jdoe, asmith}@example.edu slee@example.org", 12, "cour"),
+                             ("Department of Computer Science, Example University", 12, "helv"),
+                             ("Abstract", 12, "hebo"),
+                             (BODY, 10, "helv"),
+                             ("1. Introduction", 12, "hebo"),
+                             (BODY, 10, "helv")]:
+        rect = fitz.Rect(60, y, 540, y + 200)
+        page.insert_textbox(rect, text, fontsize=size, fontname=font)
+        y += 30 if size > 10 else 70
+    doc.save(path)
+    doc.close()
+
+@pytest.mark.parametrize("title", [
+    "A Short Survey of Vision Language Models",
+    "A Survey of State of the Art Large Vision Language Models: Alignment, Benchmark, Evaluations and Challenges",
+])
+def test_title_block_lines_are_not_headings(tmp_path, title):
+    path = str(tmp_path / "paper.pdf")
+    write_title_page(path, title)
+    
+    headings = [heading for page in PDFProcessor().iter_pages(path) for _, heading in page["headings"]]
+    
+    expected = ["Abstract", "1. Introduction"]
+    assert headings == ([title] if len(title) <= 100 else []) + expected
@@ -0,0 +1,79 @@
+from src.benchmarks.fakes import HashingEmbedder
+from src.pipeline import data_processing
+from src.pipeline.data_processing import DataProcessor
+from src.pipeline.vector_index import LocalVectorIndex
+
+class FakeCursor:
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+    
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        if query.startswith("INSERT INTO documents"):
+            self.conn.documents[params[0]] = params[3]
+            self.result = [(1,)]
+        elif query.startswith("SELECT content_hash FROM documents"):
+            content_hash = self.conn.documents.get(params[0])
+            self.result = [(content_hash,)] if content_hash else []
+        elif query.startswith("DELETE FROM chunks WHERE id = ANY"):
+            for chunk_id in params[0]:
+                self.conn.chunks.pop(chunk_id, None)
+    
+    def fetchone(self):
+        return self.result[0] if self.result else None
+    
+    def close(self):
+        pass
+
+class FakeConnection:
+    
+    def __init__(self, documents):
+        self.documents = dict(documents)
+        self.chunks = {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def cursor(self):
+        return FakeCursor(self)
+
+def make_chunks(start, count):
+    return [{"text": f"section {i} text", "chunk_index": i, "section_title": f"S{i}"}
+            for i in range(start, start + count)]
+
+def run_failing_stream(monkeypatch, tmp_path, stored_hash, new_hash):
+    def batches(pdf_directory, pdf_files, on_error=None):
+        yield "long.pdf", make_chunks(0, 3), None
+        on_error("long.pdf", RuntimeError("parse failed on page 300"))
+    
+    monkeypatch.setattr(data_processing, "iter_processed_batches", batches)
+    monkeypatch.setattr(data_processing, "execute_values",
+                        lambda cursor, query, rows, page_size=None: cursor.conn.chunks.update((r[0], r) for r in rows))
+    processor = DataProcessor()
+    processor.embedder = HashingEmbedder()
+    processor.pg_conn = FakeConnection({"long.pdf": stored_hash})
+    processor.vector_store = LocalVectorIndex(path=str(tmp_path)).load(writable=True)
+    processor.plan_ingestion = lambda *args: ({"long.pdf": new_hash}, [], 0)
+    stats = processor.process_all_documents(str(tmp_path))
+    first_batch = [processor.make_chunk_id("long.pdf", new_hash, i) for i in range(3)]
+    return processor, stats, first_batch
+
+def test_failed_stream_drops_stored_batches(monkeypatch, tmp_path):
+    processor, stats, first_batch = run_failing_stream(monkeypatch, tmp_path, "old", "new")
+    
+    assert stats.failures_by_stage == {"parse": 1}
+    assert processor.pg_conn.documents == {"long.pdf": "old"}
+    assert processor.pg_conn.chunks == {}
+    assert processor.vector_store.get(ids=first_batch, include=[])["ids"] == []
+
+def test_failed_stream_of_unchanged_document_keeps_its_chunks(monkeypatch, tmp_path):
+    # A forced rerun writes the IDs the current version is served from
+    processor, stats, first_batch = run_failing_stream(monkeypatch, tmp_path, "same", "same")
+    
+    assert sorted(processor.pg_conn.chunks) == sorted(first_batch)
+    assert sorted(processor.vector_store.get(ids=first_batch, include=[])["ids"]) == sorted(first_batch)
@@ -0,0 +1,108 @@
+import psycopg2
+from src.pipeline.ingest_worker import IngestWorker
+
+JOB = (7, "rescan", None, "running", 0, 0, 0, 0, None, None, None, None, None)
+
+class FakeCursor:
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rows = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def execute(self, query, params=None):
+        if self.conn.pool.kill_next:
+            # Postgres restarted under an open connection
+            self.conn.pool.kill_next -= 1
+            self.conn.closed = 1
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.pool.queries.append(query)
+        self.description = [("id",)]
+        self.rows = []
+        if "SET status = 'running'" in query and self.conn.pool.jobs:
+            self.conn.pool.jobs -= 1
+            self.rows = [JOB]
+    
+    def fetchall(self):
+        return self.rows
+
+class FakeConnection:
+    
+    def __init__(self, pool):
+        self.pool = pool
+        self.closed = 0
+    
+    def cursor(self):
+        return FakeCursor(self)
+    
+    def commit(self):
+        pass
+    
+    def rollback(self):
+        pass
+
+class FakePool:
+    
+    def __init__(self, kill_next=0, down=0, jobs=1):
+        self.kill_next = kill_next
+        self.down = down
+        self.jobs = jobs
+        self.queries = []
+        self.closed = []
+    
+    def getconn(self):
+        if self.down:
+            self.down -= 1
+            raise psycopg2.OperationalError("could not connect to server: Connection refused")
+        return FakeConnection(self)
+    
+    def putconn(self, conn, close=False):
+        if close:
+            self.closed.append(conn)
+    
+    def closeall(self):
+        pass
+
+def make_worker(pool):
+    worker = IngestWorker(directory="/nonexistent", poll_interval=0.001, watch=False, nice=0, metrics_port=0)
+    worker.store.connect = lambda: setattr(worker.store, "pool", pool)
+    worker.processor.initialize_connections = lambda: None
+    worker.processor.ensure_connections = lambda: None
+    worker.processor.process_all_documents = lambda *args, **kwargs: None
+    return worker
+
+def test_job_queue_retries_on_a_killed_connection():
+    pool = FakePool(kill_next=1)
+    worker = make_worker(pool)
+    worker.store.connect()
+    
+    assert worker.jobs.claim()["id"] == 7
+    assert len(pool.closed) == 1
+
+def test_worker_survives_postgres_restart_mid_loop():
+    # More failed connects than the per-statement retries cover, so the loop itself has to back off
+    pool = FakePool(down=5)
+    worker = make_worker(pool)
+    worker.store.max_retries = 2
+    finished = []
+    worker.jobs.finish = lambda job_id, stats, error=None: (finished.append((job_id, error)), worker.stop())
+    
+    worker.run()
+    
+    assert finished == [(7, None)]
+
+def test_failed_finish_leaves_the_job_for_requeue():
+    pool = FakePool()
+    worker = make_worker(pool)
+    worker.store.connect()
+    pool.kill_next = worker.store.max_retries + 1
+    
+    worker.run_job({"id": 7, "kind": "rescan", "filename": None})
+    
+    assert not any("finished_at" in query for query in pool.queries)
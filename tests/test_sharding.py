@@ -0,0 +1,34 @@
+import threading
+import time
+import pytest
+from src.pipeline.sharding import ChromaShards, shard_for
+
+class HungCollection:
+    
+    def __init__(self, released: threading.Event):
+        self.released = released
+    
+    def query(self, **kwargs):
+        # Bounded only so a regression fails instead of hanging the suite
+        self.released.wait(5)
+        return {"ids": [[]], "distances": [[]], "metadatas": [[]], "documents": [[]]}
+
+@pytest.mark.parametrize("shard_count", [1, 2])
+def test_read_from_one_hung_shard_is_bounded(shard_count):
+    released = threading.Event()
+    shards = ChromaShards(shards=shard_count, hosts=[("chromadb", 8000)], timeout_ms=50, workers=shard_count)
+    # With two shards the filename filter routes the read to its document's shard alone
+    shards.collections = [HungCollection(released) for _ in range(shard_count)]
+    where = {"filename": "paper.pdf"} if shard_count > 1 else None
+    try:
+        for _ in range(3):
+            started = time.perf_counter()
+            with pytest.raises(TimeoutError):
+                shards.query([[0.0, 1.0]], n_results=1, where=where)
+            assert time.perf_counter() - started < 1
+        # The hung call still holds the shard's only slot, so later reads are turned away without a thread
+        assert not shards.slots[shard_for("paper.pdf", shard_count)].acquire(blocking=False)
+    finally:
+        released.set()
+        if shards.executor:
+            shards.executor.shutdown()